@@ -8,6 +8,7 @@ from collections import defaultdict
 
 from common import *
 from corpus import Corpus
+from sparse import FeatureFile
 from tree import Tree
 
 logs = sys.stderr
@@ -38,11 +39,11 @@ class Argument(object):
         while target is not None and prune_level < prune_level_limit:
             if target.parent_node is not None:
                 siblings = target.parent_node.child_nodes
-                candidate |= {(n, n.linker) for n in siblings if n != target}
+                candidate |= {(n, relation.linker(n)) for n in siblings if n != target}
             # target node doesn't cover conn leaves exactly
-            exact_cover = len(target.get_leaves()) == len(conn_leaves)
+            exact_cover = target.num_leaves() == len(conn_leaves)
             if not exact_cover:
-                candidate |= {(n, n.linker) for n in target.child_nodes if n != conn_node}
+                candidate |= {(n, relation.linker(n)) for n in target.child_nodes if n != conn_node}
             if which == 'test' and (target.value == 'IP' or target.value == 'S'):
                 target = None
             else:
@@ -56,8 +57,8 @@ class Argument(object):
                 prev_tree = relation.article.sentences[sid-1].tree
                 if not prev_tree.is_null():
                     prev_root = prev_tree.root
-                    if prev_root.linker == 'arg1':
-                        candidate.add( (prev_root, prev_root.linker) )
+                    if relation.linker(prev_root) == 'arg1':
+                        candidate.add( (prev_root, 'arg1') )
                     else:
                         candidate.add( (prev_root, 'None') )
 
@@ -109,25 +110,23 @@ class Argument(object):
         else:
             candidates = self.pruning(conn_node, relation, which)
         for node, label in candidates:
-            to_file_line = ''
-            to_file_line += 'conn:'+conn_str+' '
-            to_file_line += 'conn_lc:'+conn_str.lower()+' '
-            to_file_line += 'nt_cat:'+node.value
+            features = [('conn:'+conn_str, 1), ('conn_lc:'+conn_str.lower(), 1)]
+            nt = 'nt_cat:'+node.value
             if node.parent_node is not None:
-                to_file_line += '^nt_pt:' + node.parent_node.value
+                nt += '^nt_pt:' + node.parent_node.value
                 curr_idx = node.parent_node.child_nodes.index(node)
                 if curr_idx > 0:
-                    to_file_line += '^nt_lsib:' + node.parent_node.child_nodes[curr_idx - 1].value
+                    nt += '^nt_lsib:' + node.parent_node.child_nodes[curr_idx - 1].value
                 else:
-                    to_file_line += '^nt_lsib:NULL'
+                    nt += '^nt_lsib:NULL'
 
                 if curr_idx < len(node.parent_node.child_nodes) - 1:
-                    to_file_line += '^nt_rsib:' + node.parent_node.child_nodes[curr_idx + 1].value
+                    nt += '^nt_rsib:' + node.parent_node.child_nodes[curr_idx + 1].value
                 else:
-                    to_file_line += '^nt_rsib:NULL'
+                    nt += '^nt_rsib:NULL'
             else:
-                to_file_line += '^nt_pt:NULL'
-            to_file_line += ' '
+                nt += '^nt_pt:NULL'
+            features.append((nt, 1))
             node_root = node.goto_tree().root
             if curr_root != node_root:
                 path, _ = Tree.find_constituent_path(conn_node, curr_root)
@@ -135,16 +134,16 @@ class Argument(object):
             else:
                 path, _ = Tree.find_constituent_path(conn_node, node)
             relpos = Tree.relative_position(conn_node, node)
-            to_file_line += 'conn_to_node:'+path+' '
+            features.append(('conn_to_node:'+path, 1))
             lsibs = conn_node.all_left_siblings()
             rsibs = conn_node.all_right_siblings()
-            to_file_line += 'conn_node_lsib_size='+str(len(lsibs))+' '
-            to_file_line += 'conn_node_rsib_size='+str(len(rsibs))+' '
+            features.append(('conn_node_lsib_size', len(lsibs)))
+            features.append(('conn_node_rsib_size', len(rsibs)))
             if len(lsibs) > 1 :
-                to_file_line += 'conn_to_node:'+path+'^conn_node_lsib_size:>1 '
+                features.append(('conn_to_node:'+path+'^conn_node_lsib_size:>1', 1))
 
-            to_file_line += 'conn_to_node_relpos:'+relpos+' '
-            to_file.write('%s %s\n' % (to_file_line, label))
+            features.append(('conn_to_node_relpos:'+relpos, 1))
+            to_file.add(features, label)
 
         return [c[0] for c in candidates]
 
@@ -169,35 +168,38 @@ class Argument(object):
             return False
 
     def prepare_data(self, parse_path, rel_path, which, to_file):
-        count = 0
         processed = []
         rel_dict = Corpus.read_relations(rel_path)
         for art in Corpus.read_parses(parse_path, rel_dict):
-            for rel in art.relations:
-                if rel.rel_type != 'Explicit':
-                    continue
-                rel.article = art
-                rel.get_conn_leaves()
-                rel.get_arg_leaves()
+            processed += self.prepare_article(art, which, to_file)
 
-                # add a filter function (2015/9/29)
-                if which == 'train' and not self.need_extract(rel):
-                    continue
-                count += 1
-
-                processed.append(self.print_features(rel, which, to_file))
+        print >> logs, "processed %d instances" % len(processed)
+        return processed
 
-        print >> logs, "processed %d instances" % count
+    def prepare_article(self, art, which, to_file):
+        processed = []
+        for rel in art.relations:
+            if rel.rel_type != 'Explicit':
+                continue
+            rel.article = art
+            rel.get_conn_leaves()
+            rel.get_arg_leaves()
+
+            # add a filter function (2015/9/29)
+            if which == 'train' and not self.need_extract(rel):
+                continue
+
+            processed.append(self.print_features(rel, which, to_file))
         return processed
 
     def train(self):
-        to_file = open(self.train_file, 'w')
+        to_file = FeatureFile(self.train_file)
         self.prepare_data(TRAIN_PARSE_PATH, TRAIN_REL_PATH, 'train', to_file)
         to_file.close()
-        Corpus.train_with_opennlp(self.train_file, self.model_file)
+        Corpus.train_maxent(self.train_file, self.model_file)
 
     def test(self):
-        to_file = open(self.test_file, 'w')
+        to_file = FeatureFile(self.test_file)
         self.prepare_data(DEV_PARSE_PATH, DEV_REL_PATH, 'test', to_file)
         to_file.close()
         Corpus.test_with_opennlp(self.test_file, self.model_file, self.predicted_file)
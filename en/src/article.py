@@ -6,6 +6,8 @@ from sentence import Sentence
 from relation import Relation
 from paragraph import Paragraph
 from common import DEV_RAW_PATH
+from bisect import bisect_right
+from collections import defaultdict
 
 logs = sys.stderr
 
@@ -14,7 +16,8 @@ class Article(object):
     __slots__ = ('id', 'params', 'sentences', 'paragraphs', 'disc_connectives',
                  'entity_relations', 'relations', 'exp_disc_conns', 'implicit_relations', 'real_inter_relations',
                  'real_intra_relations', 'auto_inter_relations', 'auto_intra_relations', 'exp_relations',
-                 'nonexp_relations', 'auto_exp_relations', 'auto_nonexp_relations', 'auto_all_relations', 'raw_text_path')
+                 'nonexp_relations', 'auto_exp_relations', 'auto_nonexp_relations', 'auto_all_relations', 'raw_text_path',
+                 'relation_index', 'exp_relation_index')
 
     def __init__(self, name, params):
         self.id = name
@@ -35,8 +38,14 @@ class Article(object):
         # auto all relations
         self.auto_all_relations = []
 
+        # (arg1_sid, arg2_sid) -> relations, see index_relation and index_exp_relation
+        self.relation_index = defaultdict(list)
+        self.exp_relation_index = defaultdict(list)
+
     def read_raw_text(self, raw_text_path):
-        characters = ''.join(open(raw_text_path).readlines())
+        with open(raw_text_path) as f:
+            characters = f.read()
+        self.paragraphs = []
         begin = 8  # each article begins with ".START\n\n"
         pid = 0
         while 1:
@@ -47,14 +56,14 @@ class Article(object):
             pid += 1
             begin = pc + 2  # '\n\n'
 
+        # paragraphs are disjoint and in offset order, so only the last one
+        # beginning at or before a sentence can contain it
+        begins = [para.begin_offset for para in self.paragraphs]
         for sen in self.sentences:
-            flag = False
-            for para in self.paragraphs:
-                if sen.begin_offset >= para.begin_offset and sen.end_offset <= para.end_offset:
-                    para.sentences.append(sen)
-                    flag = True
-                    break
-            if not flag:
+            i = bisect_right(begins, sen.begin_offset) - 1
+            if i >= 0 and sen.end_offset <= self.paragraphs[i].end_offset:
+                self.paragraphs[i].sentences.append(sen)
+            else:
                 print >> logs, 'sentence outof paragraph'
 
     def set_article_level_word_id(self):
@@ -72,26 +81,22 @@ class Article(object):
                 for leaf, wid in zip(sen.leaves, sen.word_ids):
                     leaf.leaf_id = wid
 
-    def has_exp_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        sid2 = self.sentences[idx+1].id
+    def index_relation(self, rel):
+        """ called as the arguments of an annotated relation are resolved """
+        if len(rel.arg1_leaves) > 0 and len(rel.arg2_leaves) > 0:
+            key = (rel.arg1_leaves[-1].goto_tree().sent_id, rel.arg2_leaves[0].goto_tree().sent_id)
+            if rel not in self.relation_index[key]:
+                self.relation_index[key].append(rel)
 
-        for rel in self.exp_relations:
-            if rel.arg1_sid == sid1 and rel.arg2_sid == sid2:
-                return True
-        return False
+    def index_exp_relation(self, rel):
+        """ called once arg1_sid and arg2_sid of an explicit relation are set """
+        self.exp_relation_index[(rel.arg1_sid, rel.arg2_sid)].append(rel)
 
-    def has_annotated_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        sid2 = self.sentences[idx+1].id
-
-        for rel in self.relations:
-            rel.arg1_sid = rel.arg1_leaves[-1].goto_tree().sent_id if len(rel.arg1_leaves) > 0 else -1
-            rel.arg2_sid = rel.arg2_leaves[0].goto_tree().sent_id if len(rel.arg2_leaves) > 0 else -1
-            if sid1 == rel.arg1_sid and sid2 == rel.arg2_sid:
-                return True
-        return False
+    def has_exp_relation(self, idx):
+        return (self.sentences[idx].id, self.sentences[idx+1].id) in self.exp_relation_index
 
+    def has_annotated_relation(self, idx):
+        return (self.sentences[idx].id, self.sentences[idx+1].id) in self.relation_index
 
 if __name__ == '__main__':
     art = Article('wsj_2200', {})
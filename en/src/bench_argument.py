@@ -0,0 +1,119 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark argument feature extraction with the indexed tree queries against
+the breadth first searches they replaced, asserting that the features agree
+"""
+import sys
+import time
+import argparse
+
+from common import DEV_PARSE_PATH, DEV_REL_PATH
+from corpus import Corpus
+from argument import Argument
+from tree import Tree
+
+logs = sys.stderr
+
+
+class RowBatch(list):
+    """ stand-in for the SparseBatch handed to print_features, keeps the added rows """
+    def add(self, features, label):
+        self.append((features, label))
+
+
+def legacy_find_highest_common_ancestor(self, nodes):
+    if len(nodes) == 0:
+        print >> logs, "error: empty nodes"
+        return
+    else:
+        lca = None
+        queue = [self.root]
+        while len(queue) != 0:
+            curr = queue.pop(0)
+            leaves = curr.get_leaves()
+            if len(leaves) != 0 and len(set(leaves)-set(nodes)) == 0:
+                lca = curr
+                break
+            else:
+                for ch in curr.child_nodes:
+                    queue.append(ch)
+        return lca
+
+
+def legacy_find_least_common_ancestor(nodes, with_leaves=False):
+    if len(nodes) == 0:
+        return None
+    elif len(nodes) == 1:
+        lca = nodes[0]
+        if lca.is_leaf:
+            lca = lca.parent_node
+        return lca
+    else:
+        lca = None
+        queue = [nodes[0].goto_tree().root]
+        while len(queue) != 0:
+            curr = queue.pop(0)
+            if len(set(curr.get_all_nodes(with_leaves)) & (set(nodes))) == len(nodes):
+                lca = curr
+                for ch in curr.child_nodes:
+                    queue.append(ch)
+        return lca
+
+
+def legacy_relative_position(node1, node2):
+    root = node1.goto_tree().root
+    if node1 == node2 or node2 == root:
+        return '0'
+    curr = node1
+    rsibs = []
+    lsibs = []
+    while curr != root:
+        rsibs += curr.all_right_siblings()
+        lsibs += curr.all_left_siblings()
+        curr = curr.parent_node
+        if curr == node2:
+            return '0'
+    for rsib in rsibs:
+        if node2 in rsib.get_all_nodes():
+            return '1'
+
+    for lsib in lsibs:
+        if node2 in lsib.get_all_nodes():
+            return '2'
+
+    return '0'
+
+
+def extract(handler, articles, rounds):
+    start = time.time()
+    for _ in range(rounds):
+        batch = RowBatch()
+        for art in articles:
+            handler.prepare_article(art, 'test', batch)
+    return batch, (time.time() - start) / rounds
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser("Argument feature extraction benchmark")
+    arg_parser.add_argument('-p', '--parse_path', help='parses.json of the data set', default=DEV_PARSE_PATH)
+    arg_parser.add_argument('-r', '--rel_path', help='relations.json of the data set', default=DEV_REL_PATH)
+    arg_parser.add_argument('-n', '--rounds', help='extraction rounds to average over', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    articles = list(Corpus.read_parses(args.parse_path, Corpus.read_relations(args.rel_path)))
+    handler = Argument()
+
+    rows, indexed_time = extract(handler, articles, args.rounds)
+
+    Tree.find_highest_common_ancestor = legacy_find_highest_common_ancestor
+    Tree.find_least_common_ancestor = staticmethod(legacy_find_least_common_ancestor)
+    Tree.relative_position = staticmethod(legacy_relative_position)
+    legacy_rows, legacy_time = extract(handler, articles, args.rounds)
+
+    # candidates come out of a set, only the multiset of rows is comparable
+    assert sorted(rows) == sorted(legacy_rows), 'the tree index changed the argument features'
+    print 'instances: %d' % len(rows)
+    print 'breadth first search: %.3f sec' % legacy_time
+    print 'tree index: %.3f sec' % indexed_time
+    print 'speedup: %.2fx' % (legacy_time / indexed_time)
@@ -0,0 +1,90 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the L-BFGS trainer against eval/CreateModel.java (GIS) on a
+component's training file, comparing training time and dev accuracy.
+Asserts that the in-process scorer agrees with itself on lines and on a
+SparseBatch, and with eval/Predict.java on the GIS model when java ran
+"""
+import os
+import sys
+import time
+import codecs
+import argparse
+
+import logreg
+from corpus import Corpus
+from logreg import train_model, read_batch
+from maxent import load_model
+
+logs = sys.stderr
+
+COMPONENTS = ['conn', 'arg', 'exp', 'nonexp', 'attr']
+
+
+def accuracy(model_file, test_file):
+    """ a prediction is right if it is one of the '|' separated gold labels """
+    lines = codecs.open(test_file, 'r', 'utf-8').readlines()
+    gold = [l.rstrip('\r\n').split(' ')[-1].split('|') for l in lines]
+    pred = load_model(model_file).predict(lines)
+    return sum(1 for p, g in zip(pred, gold) if p in g) / float(max(1, len(lines)))
+
+
+def check_scorer(model_file, test_file, java=False):
+    """ fails loudly if the predictions of the scorers differ """
+    lines = codecs.open(test_file, 'r', 'utf-8').readlines()
+    model = load_model(model_file)
+    pred = model.predict(lines)
+    assert model.predict_batch(read_batch(test_file)) == pred, \
+        'lines and SparseBatch rows are scored differently by %s' % model_file
+    if java:
+        predict_file = model_file + '.predicted'
+        Corpus.test_with_opennlp(test_file, model_file, predict_file)
+        java_pred = [l.rstrip('\r\n').split(' ')[-1] for l in codecs.open(predict_file, 'r', 'utf-8')]
+        assert java_pred == pred, 'eval/Predict.java and the in-process scorer disagree on %s' % model_file
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser("L-BFGS against GIS maxent training benchmark")
+    arg_parser.add_argument('-c', '--component', help='data/conll.<component>.{train,test}', choices=COMPONENTS,
+                            default='nonexp')
+    arg_parser.add_argument('-d', '--data_home', help='directory of the training and test files',
+                            default=os.path.dirname(os.path.abspath(__file__)) + '/../data')
+    arg_parser.add_argument('-g', '--gis_model', help='an already trained GIS model instead of training one')
+    arg_parser.add_argument('--l1', help='L1 penalty', type=float, default=0.0)
+    arg_parser.add_argument('--l2', help='L2 penalty', type=float, default=1.0)
+    arg_parser.add_argument('-i', '--iterations', help='L-BFGS iterations at most', type=int, default=100)
+    arg_parser.add_argument('-w', '--workers', help='gradient processes without numpy, all cores by default',
+                            type=int)
+    args = arg_parser.parse_args()
+
+    train_file = '%s/conll.%s.train' % (args.data_home, args.component)
+    test_file = '%s/conll.%s.test' % (args.data_home, args.component)
+    lbfgs_model = '%s/conll.%s.lbfgs.model' % (args.data_home, args.component)
+
+    gis_model, gis_time = args.gis_model, None
+    if gis_model is None:
+        gis_model = '%s/conll.%s.gis.model' % (args.data_home, args.component)
+        start = time.time()
+        if Corpus.train_with_opennlp(train_file, gis_model) != 0:
+            print >> logs, 'CreateModel.java failed, pass a GIS model with -g'
+            sys.exit(1)
+        gis_time = time.time() - start
+
+    start = time.time()
+    train_model(train_file, lbfgs_model, args.l1, args.l2, args.iterations, args.workers)
+    lbfgs_time = time.time() - start
+
+    print 'component: %s' % args.component
+    backend = 'numpy' if logreg.numpy is not None else 'python, workers: %s' % (args.workers or 'all cores')
+    print 'L-BFGS loss: %s' % backend
+    if gis_time is not None:
+        print 'GIS training: %.1f sec' % gis_time
+    print 'L-BFGS training: %.1f sec' % lbfgs_time
+    if gis_time is not None:
+        print 'speedup: %.2fx' % (gis_time / lbfgs_time)
+    if os.path.exists(test_file):
+        check_scorer(gis_model, test_file, java=gis_time is not None)
+        check_scorer(lbfgs_model, test_file)
+        print 'GIS dev accuracy: %.4f' % accuracy(gis_model, test_file)
+        print 'L-BFGS dev accuracy: %.4f' % accuracy(lbfgs_model, test_file)
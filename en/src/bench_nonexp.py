@@ -0,0 +1,101 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the word pair and brown cluster pair features of the non-explicit
+classifier against the loops over all leaf pairs they replaced, asserting
+that the features agree
+"""
+import sys
+import time
+import argparse
+from collections import defaultdict
+
+from common import TRAIN_PARSE_PATH, TRAIN_REL_PATH, TRAIN_RAW_PATH
+from corpus import Corpus
+from feature import Feature
+from nonexp import NonExplicit
+
+logs = sys.stderr
+
+
+class RowBatch(list):
+    """ stand-in for the SparseBatch handed to print_features, keeps the added rows """
+    def add(self, features, label):
+        self.append((features, label))
+
+
+def legacy_extract_word_pair(self, rel):
+    tmp = set()
+    for w1 in rel.arg1_leaves:
+        for w2 in rel.arg2_leaves:
+            k = w1.stem + "_" + w2.stem
+            if k in self.word_dict:
+                tmp.add(k)
+
+    return ["%s:1" % k for k in tmp]
+
+
+def legacy_extract_brown_cluster(self, rel):
+    tmp = set()
+    for w1 in rel.arg1_leaves:
+        for w2 in rel.arg2_leaves:
+            k = 'b:'+self.brown_cluster.get(w1.value, 'nil') + '_b:' \
+                    + self.brown_cluster.get(w2.value, 'nil')
+            tmp.add(k)
+
+    return ["%s:1" % k for k in tmp]
+
+
+def extract(handler, articles, raw_home, rounds):
+    """ :return: the feature rows, the seconds per round and the seconds spent in the pair features """
+    timed = {'pairs': 0.0}
+    word_pair, brown_cluster = Feature.extract_word_pair, Feature.extract_brown_cluster
+
+    def timing(func):
+        def wrapper(self, rel):
+            start = time.time()
+            res = func(self, rel)
+            timed['pairs'] += time.time() - start
+            return res
+        return wrapper
+    Feature.extract_word_pair = timing(word_pair)
+    Feature.extract_brown_cluster = timing(brown_cluster)
+
+    start = time.time()
+    for _ in range(rounds):
+        batch = RowBatch()
+        for art in articles:
+            # NoRel relations are built again in every round
+            art.nonexp_relations = []
+            handler.prepare_article(art, raw_home, 'train', batch, defaultdict(int))
+    total = time.time() - start
+
+    Feature.extract_word_pair, Feature.extract_brown_cluster = word_pair, brown_cluster
+    return batch, total / rounds, timed['pairs'] / rounds
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser("Non-explicit pair feature benchmark")
+    arg_parser.add_argument('-p', '--parse_path', help='parses.json of the data set', default=TRAIN_PARSE_PATH)
+    arg_parser.add_argument('-r', '--rel_path', help='relations.json of the data set', default=TRAIN_REL_PATH)
+    arg_parser.add_argument('-w', '--raw_home', help='raw text directory of the data set', default=TRAIN_RAW_PATH)
+    arg_parser.add_argument('-n', '--rounds', help='extraction rounds to average over', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    articles = list(Corpus.read_parses(args.parse_path, Corpus.read_relations(args.rel_path)))
+    handler = NonExplicit()
+
+    rows, total_time, pair_time = extract(handler, articles, args.raw_home, args.rounds)
+
+    word_pair, brown_cluster = Feature.extract_word_pair, Feature.extract_brown_cluster
+    Feature.extract_word_pair = legacy_extract_word_pair
+    Feature.extract_brown_cluster = legacy_extract_brown_cluster
+    legacy_rows, legacy_total_time, legacy_pair_time = extract(handler, articles, args.raw_home, args.rounds)
+    Feature.extract_word_pair, Feature.extract_brown_cluster = word_pair, brown_cluster
+
+    # the sets are filled in the same order, so even the feature order must agree
+    assert rows == legacy_rows, 'the pair lookups changed the non-explicit features'
+    print 'instances: %d' % len(rows)
+    print 'all leaf pairs: %.3f sec, %.3f sec in pair features' % (legacy_total_time, legacy_pair_time)
+    print 'distinct values: %.3f sec, %.3f sec in pair features' % (total_time, pair_time)
+    print 'speedup of pair features: %.2fx' % (legacy_pair_time / pair_time)
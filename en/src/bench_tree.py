@@ -0,0 +1,177 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmark the bracket parser of Tree against the regex based parser it replaced,
+the baseline tree.py kept as tree_legacy.py, and CompactTree against Tree.
+Asserts that all of them build the same node graphs and answer the ancestor
+and subtree queries alike, and that ParseReader decodes what json.load does
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cPickle
+
+from multiprocessing import Pool
+from common import DEV_PARSE_PATH
+from corpus import ParseReader
+import tree_legacy
+from tree import Tree, CompactTree
+
+logs = sys.stderr
+
+
+_unset = object()
+
+
+def structure(tree):
+    """
+    pre-order list of the node attributes set by parsing, with the
+    pre-order position of each node's parent; the old parser did not
+    give leaves a tree reference, so theirs is not compared
+    """
+    if not hasattr(tree, 'root'):
+        return None
+    res = []
+    position = {}
+    stack = [tree.root]
+    while len(stack) > 0:
+        node = stack.pop()
+        position[node] = len(res)
+        parent = position.get(node.parent_node, -1)
+        res.append((node.value, node.lowercased, getattr(node, 'fun_tag', _unset) is _unset,
+                    getattr(node, 'fun_tag', None), node.is_root, node.is_pos, node.is_leaf,
+                    node.is_NONE_leaf, node.is_leaf or node.tree is tree, len(node.child_nodes), parent))
+        stack.extend(reversed(node.child_nodes))
+    return res
+
+
+def preorder(tree):
+    res = []
+    stack = [tree.root]
+    while len(stack) > 0:
+        node = stack.pop()
+        res.append(node)
+        stack.extend(reversed(node.child_nodes))
+    return res
+
+
+def queries(tree):
+    """
+    answers of the tree queries, nodes given by their pre-order position:
+    subtrees, least and highest common ancestors, relative positions and
+    the subtrees covering spans of leaves
+    """
+    if not hasattr(tree, 'root'):
+        return None
+    nodes = preorder(tree)
+    position = dict((node, i) for i, node in enumerate(nodes))
+    position[None] = None
+    inner = [n for n in nodes if not n.is_leaf]
+    leaves = [n for n in nodes if n.is_leaf and not n.is_NONE_leaf]
+    lca = type(tree).find_least_common_ancestor
+    res = []
+    for node in inner:
+        res.append([position[n] for n in node.get_all_nodes()])
+        res.append([position[n] for n in node.get_all_nodes(True)])
+    for k in range(len(leaves)):
+        res.append(position[lca(leaves[:k+1], True)])
+        res.append(position[lca(leaves[k:k+2], True)])
+        res.append([position[n] for n in tree.find_subtrees(leaves[:k])])
+        res.append([position[n] for n in tree.find_subtrees(leaves[k:])])
+        res.append(position[tree.find_highest_common_ancestor(leaves[k:])])
+    for node1, node2 in zip(inner, inner[1:] + inner[-1:]):
+        res.append(position[lca([node1, node2])])
+        res.append(type(tree).relative_position(node1, node2))
+        res.append(type(tree).relative_position(node2, node1))
+        res.append(type(tree).relative_position(inner[-1], node1))
+    return res
+
+
+def check(reference, trees, texts, what):
+    """ fails loudly on the first tree whose structure or queries differ """
+    for sid, (t1, t2) in enumerate(zip(reference, trees)):
+        assert structure(t1) == structure(t2), 'different %s structure for tree %d: %s' % (what, sid, texts[sid].strip())
+        assert queries(t1) == queries(t2), 'different %s queries for tree %d: %s' % (what, sid, texts[sid].strip())
+
+
+def run(tree_class, texts):
+    start = time.time()
+    trees = [tree_class(text, sid) for sid, text in enumerate(texts)]
+    return trees, time.time() - start
+
+
+def resident_memory():
+    """ resident set size of this process in bytes, linux only """
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def memory_of(task):
+    """ memory held by the trees of one class, measured in a fresh process """
+    tree_class, texts = task
+    before = resident_memory()
+    trees = [tree_class(text, sid) for sid, text in enumerate(texts)]
+    return resident_memory() - before
+
+
+def pickling(trees):
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, 20000))
+    try:
+        start = time.time()
+        data = cPickle.dumps(trees, cPickle.HIGHEST_PROTOCOL)
+        dump_time = time.time() - start
+    finally:
+        sys.setrecursionlimit(limit)
+    start = time.time()
+    cPickle.loads(data)
+    return len(data), dump_time, time.time() - start
+
+
+def walk(trees):
+    """ time of a pre-order walk over every node, reading the label """
+    start = time.time()
+    for tree in trees:
+        if not tree.is_null():
+            for node in tree.root.iter_preorder():
+                node.value
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser("Tree parser benchmark")
+    arg_parser.add_argument('-p', '--parse_path', help='parses.json to read trees from', default=DEV_PARSE_PATH)
+    arg_parser.add_argument('-n', '--num_docs', help='only use the first n documents', type=int)
+    args = arg_parser.parse_args()
+
+    texts = []
+    for count, (doc_id, doc) in enumerate(ParseReader(args.parse_path)):
+        if args.num_docs is not None and count >= args.num_docs:
+            break
+        texts += [s['parsetree'] for s in doc['sentences']]
+    if args.num_docs is None:
+        assert dict(ParseReader(args.parse_path)) == json.load(open(args.parse_path)), \
+            'ParseReader and json.load disagree on %s' % args.parse_path
+
+    legacy_trees, legacy_time = run(tree_legacy.Tree, texts)
+    trees, new_time = run(Tree, texts)
+    check(legacy_trees, trees, texts, 'single pass')
+
+    compact_trees, compact_time = run(CompactTree, texts)
+    check(trees, compact_trees, texts, 'compact')
+
+    print 'trees: %d' % len(texts)
+    print 'legacy parser: %.1f trees/sec' % (len(texts) / legacy_time)
+    print 'single pass parser: %.1f trees/sec' % (len(texts) / new_time)
+    print 'speedup: %.2fx' % (legacy_time / new_time)
+    print 'compact trees: %.1f trees/sec' % (len(texts) / compact_time)
+
+    pool = Pool(1, maxtasksperchild=1)
+    for name, tree_class, built in [('Tree', Tree, trees), ('CompactTree', CompactTree, compact_trees)]:
+        size, dump_time, load_time = pickling(built)
+        print '%s: %.1f MB resident, %.1f MB pickled, dump %.2f sec, load %.2f sec, walk %.2f sec' % \
+            (name, pool.apply(memory_of, [(tree_class, texts)]) / 1e6, size / 1e6, dump_time, load_time, walk(built))
+    pool.close()
+    pool.join()
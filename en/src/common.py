@@ -172,6 +172,24 @@ LIB_DIR = CURR_DIR + '/../../lib'
 CLASSPATH = CURR_DIR + '/../../eval:' + LIB_DIR + '/maxent-2.5.2/lib/trove.jar:' + \
             LIB_DIR + '/maxent-2.5.2/output/maxent-2.5.2.jar:'
 
+# pickled Articles of each parses file, None disables the cache
+CACHE_HOME = CURR_DIR + '/../cache'
+
+# parse trees as CompactTree arrays instead of Node objects, smaller in memory
+# and in the cache but slower to walk
+COMPACT_TREES = False
+
+# words whose porter2 stems are memoized, and the file keeping them between runs (None: not kept)
+STEM_CACHE_SIZE = 100000
+STEM_CACHE_PATH = None  # LIB_DIR + '/porter2-stems.txt'
+
+# trainer of the maxent models: 'gis' runs eval/CreateModel.java, 'lbfgs' trains them
+# in-process (logreg.py) with these penalties, with numpy and scipy if they are
+# installed, else with the gradient computed on every core
+MAXENT_TRAINER = 'gis'
+LBFGS_L1 = 0.0
+LBFGS_L2 = 1.0
+
 SVM_LEARN = LIB_DIR + '/svm_light/svm_learn'
 SVM_CLASSIFY = LIB_DIR + '/svm_light/svm_classify'
 
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from collections import defaultdict
+
+
+class ConnMatcher(object):
+    """
+    token trie over a list of connectives, every occurrence of every
+    connective in a sentence is found in one left to right pass
+    """
+    __slots__ = ('connectives', 'trie')
+
+    def __init__(self, connectives):
+        self.connectives = list(connectives)
+        # token -> child, the None key holds the ranks of the connectives ending there
+        self.trie = {}
+        for rank, conn in enumerate(self.connectives):
+            tokens = conn.split()
+            if len(tokens) == 0:
+                continue
+            node = self.trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node.setdefault(None, []).append(rank)
+
+    def find(self, tokens):
+        """
+        :return: [(rank, start), ...] sorted, i.e. in the order a scan of the
+        sentence per connective of the list would find them
+        """
+        matches = []
+        for i in range(len(tokens)):
+            node = self.trie
+            j = i
+            while j < len(tokens) and tokens[j] in node:
+                node = node[tokens[j]]
+                j += 1
+                if None in node:
+                    matches.extend((rank, i) for rank in node[None])
+        matches.sort()
+        return matches
+
+    def positions(self, matches):
+        """ {connective: [start, ...]} of the matches of find, starts in ascending order """
+        res = defaultdict(list)
+        for rank, i in matches:
+            res[self.connectives[rank]].append(i)
+        return res
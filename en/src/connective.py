@@ -26,7 +26,7 @@ class Connective():
         # to_file = open(self.train_file, 'w')
         # self.prepare_data(TRAIN_PARSE_PATH, TRAIN_REL_PATH, 'train', to_file)
         # to_file.close()
-        Corpus.train_with_opennlp(self.train_file, self.model_file)
+        Corpus.train_maxent(self.train_file, self.model_file)
         # gen_svm_train(self.train_file, self.train_vec_file, self.feat_map_file)
         # svm_learn(self.train_vec_file, self.model_file)
 
@@ -43,12 +43,15 @@ class Connective():
     def prepare_data(self, parse_path, rel_path, which, to_file):
         rel_dict = Corpus.read_relations(rel_path)
         for art in Corpus.read_parses(parse_path, rel_dict):
-            for rel in art.relations:
-                if rel.rel_type != 'Explicit':
-                    continue
-                rel.article = art
-                rel.get_conn_leaves()
-            self.print_features(art, which, to_file)
+            self.prepare_article(art, which, to_file)
+
+    def prepare_article(self, art, which, to_file):
+        for rel in art.relations:
+            if rel.rel_type != 'Explicit':
+                continue
+            rel.article = art
+            rel.get_conn_leaves()
+        self.print_features(art, which, to_file)
 
     def eval_data(self, stand_data, predicted_data):
         stand = [x.strip().split()[-1] for x in open(stand_data)]
@@ -94,32 +97,29 @@ class Connective():
         for sentence in article.sentences:
             all_conns = sentence.check_connectives()
             checked_conns += all_conns
-            for conn in all_conns:
+            windows = Corpus.context_window(all_conns, article)
+            for conn, (prev_word, prev_pos, next_word, next_pos) in zip(all_conns, windows):
                 conn_str = '_'.join(n.value for n in conn)
-                to_file_line = ''
-                to_file_line += 'conn_lc:'+conn_str.lower()+' '
-                to_file_line += 'conn:'+conn_str+' '
+                features = []
+                features.append(('conn_lc:'+conn_str.lower(), 1))
+                features.append(('conn:'+conn_str, 1))
 
                 conn_pos = '_'.join([x.parent_node.value for x in conn])
-                to_file_line += 'lexsyn:conn_POS:'+conn_pos+' '
+                features.append(('lexsyn:conn_POS:'+conn_pos, 1))
 
-                prev_leaf = Corpus.get_other_leaf(conn[0], -1, article)
-                if prev_leaf is not None:
-                    to_file_line += 'lexsyn:with_prev_full:'+prev_leaf.value+'_'+conn_str+' '
+                if prev_word is not None:
+                    features.append(('lexsyn:with_prev_full:'+prev_word+'_'+conn_str, 1))
 
-                    prev_pos = prev_leaf.parent_node.value
-                    to_file_line += 'lexsyn:prev_POS:'+prev_pos+' '
-                    to_file_line += 'lexsyn:with_prev_POS:'+prev_pos+'_'+conn_pos.split('_')[0]+' '
-                    to_file_line += 'lexsyn:with_prev_POS_full:'+prev_pos+'_'+conn_pos+' '
+                    features.append(('lexsyn:prev_POS:'+prev_pos, 1))
+                    features.append(('lexsyn:with_prev_POS:'+prev_pos+'_'+conn_pos.split('_')[0], 1))
+                    features.append(('lexsyn:with_prev_POS_full:'+prev_pos+'_'+conn_pos, 1))
 
-                next_leaf = Corpus.get_other_leaf(conn[-1], 1, article)
-                if next_leaf is not None:
-                    to_file_line += 'lexsyn:with_next_full:'+conn_str+'_'+next_leaf.value+' '
+                if next_word is not None:
+                    features.append(('lexsyn:with_next_full:'+conn_str+'_'+next_word, 1))
 
-                    next_pos = next_leaf.parent_node.value
-                    to_file_line += 'lexsyn:next_POS:'+next_pos+' '
-                    to_file_line += 'lexsyn:with_next_POS:'+conn_pos.split('_')[-1]+'_'+next_pos+' '
-                    to_file_line += 'lexsyn:with_next_POS_full:'+conn_pos+'_'+next_pos+' '
+                    features.append(('lexsyn:next_POS:'+next_pos, 1))
+                    features.append(('lexsyn:with_next_POS:'+conn_pos.split('_')[-1]+'_'+next_pos, 1))
+                    features.append(('lexsyn:with_next_POS_full:'+conn_pos+'_'+next_pos, 1))
 
                 # Pitler & Nenkova (ACL 09) features:
                 # self_cat, parent_cat, left_cat, right_cat, right_VP, right_trace
@@ -135,23 +135,23 @@ class Connective():
                     res2.append('rightTrace')
 
                 for e in res2:
-                    to_file_line += 'syn:'+e+' '
+                    features.append(('syn:'+e, 1))
 
                 for e in res2:
-                    to_file_line += 'conn-syn:'+'conn:'+conn_str+'-'+e+' '
+                    features.append(('conn-syn:'+'conn:'+conn_str+'-'+e, 1))
 
                 for j in range(0, len(res2)):
                     for pair in res2[j+1:]:
-                        to_file_line += 'syn-syn:'+res2[j]+'-'+pair+' '
+                        features.append(('syn-syn:'+res2[j]+'-'+pair, 1))
 
                 res3 = sentence.get_syntactic_features(*res[6])
-                to_file_line += 'path-self>root:'+res3[0]+' '
-                to_file_line += 'path-self>root2:'+res3[1]+' '
+                features.append(('path-self>root:'+res3[0], 1))
+                features.append(('path-self>root2:'+res3[1], 1))
 
                 label = '0'
                 if conn in article.disc_connectives:
                     label = '1'
-                to_file.write(to_file_line+' '+label+'\n')
+                to_file.add(features, label)
         return checked_conns
 
 if __name__ == '__main__':
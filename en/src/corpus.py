@@ -7,14 +7,19 @@ import sys
 import math
 import argparse
 import json
+import cPickle
+import hashlib
 from collections import defaultdict
 logs = sys.stderr
 
 from common import *
 from article import Article
 from feature import Feature
+from lexicon import file_digest
 from relation import Relation
-from sentence import Sentence
+from sentence import Sentence, stem_cache
+from maxent import load_model
+from logreg import train_model
 
 
 FILE_PATH = os.path.dirname(__file__)
@@ -30,14 +35,38 @@ class Corpus(object):
 
     @staticmethod
     def get_other_leaf(curr, offset, article):
-        tree = curr.goto_tree()
-        sen = article.sentences[tree.sent_id]
-        leaves = sen.leaves
-        curr_index = sen.leaves.index(curr)
-        if curr_index != -1:
-            expect_index = offset + curr_index
-            if expect_index >= 0 and expect_index < len(leaves):
-                return leaves[expect_index]
+        # a leaf spans [i, i+1) where i is its position in the leaves of its sentence
+        leaves = article.sentences[curr.goto_tree().sent_id].leaves
+        expect_index = offset + curr.span[0]
+        if expect_index >= 0 and expect_index < len(leaves):
+            return leaves[expect_index]
+
+    @staticmethod
+    def context_window(conns, article):
+        """
+        :param conns: candidate connectives, lists of leaves
+        :return: [(prev word, prev POS, next word, next POS), ...] for the leaves
+        around each connective, None past the edges of its sentence
+        """
+        # words and POS tags of each sentence are listed once for the whole batch
+        columns = {}
+
+        def column(leaf):
+            sid = leaf.goto_tree().sent_id
+            if sid not in columns:
+                leaves = article.sentences[sid].leaves
+                columns[sid] = ([n.value for n in leaves], [n.parent_node.value for n in leaves])
+            return columns[sid]
+
+        res = []
+        for conn in conns:
+            words, tags = column(conn[0])
+            i = conn[0].span[0] - 1
+            prev = (words[i], tags[i]) if 0 <= i < len(words) else (None, None)
+            words, tags = column(conn[-1])
+            i = conn[-1].span[0] + 1
+            res.append(prev + ((words[i], tags[i]) if 0 <= i < len(words) else (None, None)))
+        return res
 
     @staticmethod
     def load_brown_cluster(brown_cluster_path):
@@ -57,26 +86,43 @@ class Corpus(object):
         return rel_dict
 
     @staticmethod
-    def read_parses(parse_path, relations_dict=None):
-        parses = [json.loads(x) for x in open(parse_path)]
-        for doc_id in parses[0]:
-            print >> logs, "Doc ID:%s" % doc_id
-            doc = parses[0][doc_id]
-            sentences = []
-            for sid, sen in enumerate(doc['sentences']):
-                parse_tree = sen['parsetree']
-                dep_tree = sen['dependencies']
-                words = sen['words']
-                # provided by kong
-                if sid == 0 and words[0][1]['CharacterOffsetBegin'] < 8:
-                    words[0][1]['CharacterOffsetBegin'] += 6
-                sentences.append(Sentence(sid, parse_tree, dep_tree, words))
+    def read_parses(parse_path, relations_dict=None, index=None):
+        """
+        :param index: [(doc_id, begin, end), ...] from ParseReader.index, documents are
+        read in that order; by default the whole file is read in file order, through
+        the article cache if CACHE_HOME is set
+        """
+        if index is not None:
+            docs = ParseReader(parse_path).read_documents(index)
+            articles = (Corpus.build_article(doc_id, doc) for doc_id, doc in docs)
+        elif CACHE_HOME is not None:
+            articles = ParseCache(parse_path, CACHE_HOME).read()
+        else:
+            articles = (Corpus.build_article(doc_id, doc) for doc_id, doc in ParseReader(parse_path))
+
+        for art in articles:
+            print >> logs, "Doc ID:%s" % art.id
             if relations_dict is not None:
-                relations = relations_dict[doc_id]
-            else:
-                relations = []
-            params = {'sens': sentences, 'rels':relations}
-            yield Article(doc_id, params)
+                art.relations = art.params['rels'] = relations_dict[art.id]
+            yield art
+
+        if stem_cache.hits + stem_cache.misses > 0:
+            print >> logs, stem_cache
+            stem_cache.save()
+
+    @staticmethod
+    def build_article(doc_id, doc):
+        sentences = []
+        for sid, sen in enumerate(doc['sentences']):
+            parse_tree = sen['parsetree']
+            dep_tree = sen['dependencies']
+            words = sen['words']
+            # provided by kong
+            if sid == 0 and words[0][1]['CharacterOffsetBegin'] < 8:
+                words[0][1]['CharacterOffsetBegin'] += 6
+            sentences.append(Sentence(sid, parse_tree, dep_tree, words))
+        params = {'sens': sentences, 'rels': []}
+        return Article(doc_id, params)
 
     @staticmethod
     def is_non_exp_relation(rel, which):
@@ -270,16 +316,54 @@ class Corpus(object):
                 to_file.close()
 
     @staticmethod
-    def train_with_opennlp(train_file, model_file):
-        cmd = "java -Xmx4g -cp " + CLASSPATH + " CreateModel -real " + train_file + " " + model_file
-        os.system(cmd)
+    def train_with_opennlp(train_file, model_file, options='-real'):
+        """
+        :return: exit status of CreateModel, 0 on success
+        """
+        cmd = "java -Xmx4g -cp " + CLASSPATH + " CreateModel " + options + " " + train_file + " " + model_file
+        return os.system(cmd)
+
+    @staticmethod
+    def train_with_maxent(train_file, model_file, l1=LBFGS_L1, l2=LBFGS_L2, workers=None):
+        """
+        in-process replacement of train_with_opennlp, L-BFGS instead of GIS
+        :return: 0 on success, as train_with_opennlp
+        """
+        train_model(train_file, model_file, l1, l2, workers=workers)
+        return 0
+
+    @staticmethod
+    def train_maxent(train_file, model_file, options='-real', workers=None):
+        """
+        train a model with the trainer MAXENT_TRAINER names
+        :return: 0 on success, as train_with_opennlp
+        """
+        if MAXENT_TRAINER == 'lbfgs':
+            return Corpus.train_with_maxent(train_file, model_file, workers=workers)
+        return Corpus.train_with_opennlp(train_file, model_file, options)
 
     @staticmethod
     def test_with_opennlp(test_file, model_file, predict_file):
+        model = load_model(model_file)
+        if model.bias is not None:
+            # eval/Predict.java knows nothing of the intercepts of an L-BFGS model
+            model.predict_file(test_file, predict_file)
+            return
         cmd = "java -Xmx4g -cp " + CLASSPATH + " Predict -real " + test_file + " " + model_file + " > " + \
               predict_file
         os.system(cmd)
 
+    @staticmethod
+    def predict(model_file, batch):
+        """
+        classify an in-memory feature batch
+        :param batch: SparseBatch
+        :return: predicted label of each row
+        """
+        if len(batch) == 0:
+            return []
+        return load_model(model_file).predict_batch(batch)
+
     @staticmethod
     def mallet_train(train_file, model_file, algorithm="MaxEnt"):
         """
@@ -315,6 +399,201 @@ class Corpus(object):
         os.system(cmd)
 
 
+class ParseReader(object):
+    """
+    incrementally decode the top-level {doc_id: document} object of a parses file,
+    only the document being decoded is held in memory
+    """
+    __slots__ = ('parse_path', 'chunk_size', 'decoder', 'parse_file', 'buf', 'pos', 'base')
+
+    def __init__(self, parse_path, chunk_size=1 << 20):
+        self.parse_path = parse_path
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.parse_file = None
+        self.buf = ''
+        self.pos = 0
+        self.base = 0  # file offset of buf[0]
+
+    def _read_more(self):
+        # documents are json objects, so a value cut at the end of the buffer
+        # never decodes early; the read size grows with the pending text to
+        # keep large documents linear
+        chunk = self.parse_file.read(max(self.chunk_size, len(self.buf) - self.pos))
+        if chunk == '':
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.base += self.pos
+        self.pos = 0
+        return True
+
+    def _next_char(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read_more():
+                return ''
+
+    def _expect(self, chars, after):
+        c = self._next_char()
+        if c == '' or c not in chars:
+            raise ValueError('%s: expect %s after %s' % (self.parse_path, ' or '.join(chars), after))
+        self.pos += 1
+        return c
+
+    def _decode(self):
+        self._next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self._read_more():
+                    raise
+            else:
+                self.pos = end
+                return value
+
+    def _iter_documents(self):
+        """
+        :return: generator of (doc_id, document, begin, end), begin/end are the
+        file offsets of the document
+        """
+        self.parse_file = open(self.parse_path, 'rb')
+        self.buf = ''
+        self.pos = 0
+        self.base = 0
+        try:
+            self._expect('{', 'beginning')
+            if self._next_char() == '}':
+                return
+            while True:
+                doc_id = self._decode()
+                self._expect(':', doc_id)
+                self._next_char()
+                begin = self.base + self.pos
+                doc = self._decode()
+                yield doc_id, doc, begin, self.base + self.pos
+                if self._expect(',}', doc_id) == '}':
+                    break
+        finally:
+            self.parse_file.close()
+
+    def __iter__(self):
+        for doc_id, doc, _, _ in self._iter_documents():
+            yield doc_id, doc
+
+    def index(self):
+        """
+        :return: [(doc_id, begin, end), ...] in file order
+        """
+        return [(doc_id, begin, end) for doc_id, _, begin, end in self._iter_documents()]
+
+    def read_documents(self, index):
+        """
+        read documents directly by their offsets
+        :param index: [(doc_id, begin, end), ...], e.g. a sorted slice of index()
+        """
+        parse_file = open(self.parse_path, 'rb')
+        try:
+            for doc_id, begin, end in index:
+                parse_file.seek(begin)
+                yield doc_id, json.loads(parse_file.read(end - begin))
+        finally:
+            parse_file.close()
+
+
+class ParseCache(object):
+    """
+    Articles of a parses file pickled as they are first built, keyed by the
+    content of the file and the source of the modules that build them
+    """
+    __slots__ = ('parse_path', 'cache_path')
+
+    def __init__(self, parse_path, cache_home):
+        self.parse_path = parse_path
+        key = hashlib.sha1(self.file_digest(parse_path))
+        for path in self.sources():
+            key.update(self.file_digest(path))
+        self.cache_path = '%s/%s.pkl' % (cache_home, key.hexdigest())
+
+    file_digest = staticmethod(file_digest)
+
+    @staticmethod
+    def sources():
+        """
+        source files of the modules whose code decides what a freshly built
+        Article looks like: this one and every module of this directory that
+        article.py reaches through its imports
+        """
+        files = set([os.path.abspath(__file__).replace('.pyc', '.py')])
+        todo = [sys.modules[Article.__module__]]
+        seen = set()
+        while len(todo) > 0:
+            module = todo.pop()
+            if module.__name__ in seen:
+                continue
+            seen.add(module.__name__)
+            path = os.path.abspath(module.__file__).replace('.pyc', '.py')
+            if os.path.dirname(path) != CURR_DIR:
+                continue
+            files.add(path)
+            # `from x import y' leaves only y behind, which remembers x
+            for value in vars(module).values():
+                name = value.__name__ if isinstance(value, type(sys)) else getattr(value, '__module__', None)
+                if isinstance(name, str) and name in sys.modules and hasattr(sys.modules[name], '__file__'):
+                    todo.append(sys.modules[name])
+        return sorted(files)
+
+    def read(self):
+        if os.path.exists(self.cache_path):
+            return self._load()
+        return self._build()
+
+    def _load(self):
+        print >> logs, 'load cached articles: %s' % self.cache_path
+        with open(self.cache_path, 'rb') as f:
+            while True:
+                try:
+                    yield cPickle.load(f)
+                except EOFError:
+                    break
+
+    def _build(self):
+        cache_home = os.path.dirname(self.cache_path)
+        if not os.path.isdir(cache_home):
+            os.makedirs(cache_home)
+        tmp_path = '%s.%d.tmp' % (self.cache_path, os.getpid())
+        complete = False
+        try:
+            with open(tmp_path, 'wb') as f:
+                for doc_id, doc in ParseReader(self.parse_path):
+                    art = Corpus.build_article(doc_id, doc)
+                    # pickled one by one before anyone touches them, a fresh
+                    # memo per article keeps the writer's memory flat
+                    self._dump(art, f)
+                    yield art
+            complete = True
+        finally:
+            if complete:
+                os.rename(tmp_path, self.cache_path)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+    @staticmethod
+    def _dump(art, f):
+        # parse trees and dependency chains make deep object graphs, the
+        # limit is raised only while pickling them
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, 20000))
+        try:
+            cPickle.dump(art, f, cPickle.HIGHEST_PROTOCOL)
+        finally:
+            sys.setrecursionlimit(limit)
+
+
 def test(rel_path, parse_path):
     rel_dict = Corpus.read_relations(rel_path)
     for art in Corpus.read_parses(parse_path, rel_dict):
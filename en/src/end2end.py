@@ -4,10 +4,15 @@ __author__ = 'Sheng Li'
 
 import os
 import sys
+import math
 import argparse
 import codecs
+import cStringIO
+from itertools import izip
+from multiprocessing import Pool
 
-from corpus import Corpus
+from corpus import Corpus, ParseReader
+from sparse import SparseBatch
 from relation import Relation
 from connective import Connective
 from argument import Argument
@@ -25,29 +30,44 @@ class DiscourseParser(object):
     """
     A PDTB-styled Shallow Discourse Parser
     """
-    def __init__(self):
-        self.conn_res_name = FILE_PATH+'/../tmp/conll.conn.predicted'
+    def __init__(self, dump_home=None):
+        # if set, feature/prediction files of each stage are dumped for debugging
+        self.dump_home = dump_home
+        # prefix of the dump files of the batch being parsed
+        self.dump_prefix = ''
+        self._nonexpParser = None
+
+    @property
+    def nonexpParser(self):
+        # loads the lexicons once, not once per batch, and only in the processes that parse
+        if self._nonexpParser is None:
+            self._nonexpParser = NonExplicit()
+        return self._nonexpParser
+
+    def _classify(self, name, batch, model_file):
+        labels = Corpus.predict(model_file, batch)
+        if self.dump_home is not None:
+            dump_path = '%s/%s%s' % (self.dump_home, self.dump_prefix, name)
+            batch.dump(dump_path + '.feat')
+            pred_file = codecs.open(dump_path + '.pred', 'w', 'utf-8')
+            for label in labels:
+                pred_file.write(label + '\n')
+            pred_file.close()
+        return labels
 
     def _process_parsed_conn(self, articles, which='test'):
         """
         generate explicit relation for each true discourse connective
         """
         connParser = Connective()
-        conn_feat_name = FILE_PATH + '/../tmp/conn.feat'
-        conn_feat_file = codecs.open(conn_feat_name, 'w', 'utf-8')
+        conn_batch = SparseBatch()
         checked_conns = []
         for art in articles:
-            checked_conns.append(connParser.print_features(art, which, conn_feat_file))
-        conn_feat_file.close()
-        conn_pred_name = FILE_PATH + '/../tmp/conn.pred'
-        Corpus.test_with_opennlp(conn_feat_name, connParser.model_file, conn_pred_name)
-        conn_res = [l.strip().split()[-1] for l in codecs.open(conn_pred_name, 'r', 'utf-8')]
-        assert len(checked_conns) == len(articles), 'article size not match'
-        s = 0
-        for art, cand_conns in zip(articles, checked_conns):
-            length = len(cand_conns)
-            cand_res = conn_res[s:s+length]
-            s += length
+            start = len(conn_batch)
+            checked_conns.append((art, connParser.print_features(art, which, conn_batch), start))
+        conn_res = self._classify('conn', conn_batch, connParser.model_file)
+        for art, cand_conns, s in checked_conns:
+            cand_res = conn_res[s:s+len(cand_conns)]
             for conn, label in zip(cand_conns, cand_res):
                 if label == '1':
                     rel = Relation()
@@ -57,37 +77,28 @@ class DiscourseParser(object):
                     rel.conn_leaves = conn
                     rel.conn_addr = [n.leaf_id for n in conn]
                     art.exp_relations.append(rel)
-        assert s == len(conn_res), 'conn size not match'
 
     def _process_parsed_argpos(self, articles, which='test'):
-        argpos_feat_name = FILE_PATH + '/../tmp/argpos.feat'
-        argpos_feat_file = codecs.open(argpos_feat_name, 'w', 'utf-8')
-        argpos_checked = []
+        argpos_batch = SparseBatch()
         argposParser = ArgPos()
         for art in articles:
             for rel in art.exp_relations:
-                argpos_checked.append(argposParser.print_features(rel, which, argpos_feat_file))
-        argpos_feat_file.close()
-        argpos_pred_name = FILE_PATH + '/../tmp/argpos.pred'
-        Corpus.test_with_opennlp(argpos_feat_name, argposParser.model_file, argpos_pred_name)
-        argpos_res = [l.strip().split()[-1] for l in codecs.open(argpos_pred_name, 'r', 'utf-8')]
-        return argpos_res
+                argposParser.print_features(rel, which, argpos_batch)
+        return self._classify('argpos', argpos_batch, argposParser.model_file)
 
     def _process_parsed_arg(self, articles, which='test'):
-        arg_feat_name = FILE_PATH + '/../tmp/arg.feat'
-        arg_feat_file = codecs.open(arg_feat_name, 'w', 'utf-8')
+        arg_batch = SparseBatch()
         arg_checked = []
         argParser = Argument()
         for art in articles:
             for rel in art.exp_relations:
-                arg_checked.append(argParser.print_features(rel, which, arg_feat_file))
-        arg_feat_file.close()
-        arg_pred_name = FILE_PATH + '/../tmp/arg.pred'
-        Corpus.test_with_opennlp(arg_feat_name, argParser.model_file, arg_pred_name)
-        arg_res = [l.strip().split()[-1] for l in codecs.open(arg_pred_name, 'r', 'utf-8')]
-
-        tmp_feat_name = FILE_PATH+'/../tmp/arg.prev.feat'
-        tmp_file = codecs.open(tmp_feat_name, 'w', 'utf-8')
+                start = len(arg_batch)
+                arg_checked.append((rel, argParser.print_features(rel, which, arg_batch), start))
+        arg_res = self._classify('arg', arg_batch, argParser.model_file)
+
+        # previous root of each relation as a candidate arg1
+        prev_batch = SparseBatch()
+        prev_checked = {}
         for art in articles:
             for rel in art.exp_relations:
                 conn_sid = rel.conn_leaves[0].goto_tree().sent_id
@@ -95,77 +106,55 @@ class DiscourseParser(object):
                     prev_tree = rel.article.sentences[conn_sid-1].tree
                     if not prev_tree.is_null():
                         prev_root = prev_tree.root
-                        argParser.print_features(rel, which, tmp_file, prev_root)
-        tmp_file.close()
-        tmp_pred_name = FILE_PATH + '/../tmp/arg.prev.pred'
-        Corpus.test_with_opennlp(tmp_feat_name, argParser.model_file, tmp_pred_name)
-        arg_prev_res = [l.strip().split()[-1] for l in codecs.open(tmp_pred_name, 'r', 'utf-8')]
-
-        rid = 0
-        s = 0
-        index = 0
-        for art in articles:
-            for rel in art.exp_relations:
-                args = arg_checked[rid]
-                labels = arg_res[s:s+len(args)]
-                rid += 1
-                s += len(args)
-                merge_result = argParser.merge(rel, args, labels)
-                rel.arg1_leaves = merge_result['arg1'] if 'arg1' in merge_result else []
-                conn_sid = args[0].goto_tree().sent_id
-
-                # if current sentence couldn't resovle any arg1 leaves, we
-                # consider previous root
-                if len(rel.arg1_leaves) == 0 and conn_sid > 0 and arg_prev_res[index] == 'arg1':
-                    rel.arg1_leaves = rel.article.sentences[conn_sid-1].leaves
-
-                if conn_sid > 0:
-                    index += 1
-
-                rel.arg1_leaves = self.remove_leading_tailing_punc(rel.arg1_leaves)
-                rel.arg1_addr = [n.leaf_id for n in rel.arg1_leaves]
-                rel.arg1_sid = rel.arg1_leaves[-1].goto_tree().sent_id if len(rel.arg1_leaves) > 0 else -1
-                rel.arg1_text = ' '.join(n.value for n in rel.arg1_leaves)
-                rel.arg2_leaves = merge_result['arg2'] if 'arg2' in merge_result else []
-                rel.arg2_leaves = self.remove_leading_tailing_punc(rel.arg2_leaves)
-                rel.arg2_addr = [n.leaf_id for n in rel.arg2_leaves]
-                rel.arg2_sid = rel.arg2_leaves[0].goto_tree().sent_id if len(rel.arg2_leaves) > 0 else -1
-                rel.arg2_text = ' '.join(n.value for n in rel.arg2_leaves)
-
-        assert len(arg_prev_res) == index, 'arg prev size not match'
-        assert len(arg_res) == s, 'arg candidate size not match'
+                        prev_checked[rel] = len(prev_batch)
+                        argParser.print_features(rel, which, prev_batch, prev_root)
+        arg_prev_res = self._classify('arg.prev', prev_batch, argParser.model_file)
+
+        for rel, args, s in arg_checked:
+            labels = arg_res[s:s+len(args)]
+            merge_result = argParser.merge(rel, args, labels)
+            rel.arg1_leaves = merge_result['arg1'] if 'arg1' in merge_result else []
+            conn_sid = rel.conn_leaves[0].goto_tree().sent_id
+
+            # if current sentence couldn't resovle any arg1 leaves, we
+            # consider previous root
+            if len(rel.arg1_leaves) == 0 and rel in prev_checked and arg_prev_res[prev_checked[rel]] == 'arg1':
+                rel.arg1_leaves = rel.article.sentences[conn_sid-1].leaves
+
+            rel.arg1_leaves = self.remove_leading_tailing_punc(rel.arg1_leaves)
+            rel.arg1_addr = [n.leaf_id for n in rel.arg1_leaves]
+            rel.arg1_sid = rel.arg1_leaves[-1].goto_tree().sent_id if len(rel.arg1_leaves) > 0 else -1
+            rel.arg1_text = ' '.join(n.value for n in rel.arg1_leaves)
+            rel.arg2_leaves = merge_result['arg2'] if 'arg2' in merge_result else []
+            rel.arg2_leaves = self.remove_leading_tailing_punc(rel.arg2_leaves)
+            rel.arg2_addr = [n.leaf_id for n in rel.arg2_leaves]
+            rel.arg2_sid = rel.arg2_leaves[0].goto_tree().sent_id if len(rel.arg2_leaves) > 0 else -1
+            rel.arg2_text = ' '.join(n.value for n in rel.arg2_leaves)
+            rel.article.index_exp_relation(rel)
 
     def _process_exp_sense(self, articles, which='test'):
-        exp_feat_name = FILE_PATH + '/../tmp/exp.feat'
         expParser = Explicit()
-        exp_sense_file = codecs.open(exp_feat_name, 'w', 'utf-8')
+        exp_batch = SparseBatch()
+        exp_checked = []
         for art in articles:
             for rel in art.exp_relations:
-                expParser.print_features(rel, ['xxxxx'], which, exp_sense_file)
-        exp_sense_file.close()
-        exp_pred = FILE_PATH + '/../tmp/exp.pred'
-        Corpus.test_with_opennlp(exp_feat_name, expParser.model_file, exp_pred)
+                start = len(exp_batch)
+                expParser.print_features(rel, ['xxxxx'], which, exp_batch)
+                if len(exp_batch) > start:
+                    exp_checked.append((rel, start))
+        exp_res = self._classify('exp', exp_batch, expParser.model_file)
 
-        exp_res = [l.strip().split()[-1] for l in codecs.open(exp_pred, 'r', 'utf-8')]
-        rid = 0
-        for art in articles:
-            for rel in art.exp_relations:
-                pred_sense = exp_res[rid]
-                rel.sense = [pred_sense]
-                rid += 1
+        for rel, rid in exp_checked:
+            rel.sense = [exp_res[rid]]
 
     def _process_nonexp_sense(self, articles, which):
-        nonexp_feat_name = FILE_PATH + '/../tmp/nonexp.feat'
-        nonexp_sense_file = codecs.open(nonexp_feat_name, 'w', 'utf-8')
-        nonexpParser = NonExplicit()  # change name later
+        nonexp_batch = SparseBatch()
+        nonexpParser = self.nonexpParser  # change name later
         for art in articles:
             self.generate_nonexp_relations(art)
             for rel in art.nonexp_relations:
-                nonexpParser.print_features(rel, ['xxxxx'], nonexp_sense_file)
-        nonexp_sense_file.close()
-        nonexp_pred_name = FILE_PATH + '/../tmp/nonexp.pred'
-        Corpus.test_with_opennlp(nonexp_feat_name, nonexpParser.model_file, nonexp_pred_name)
-        nonexp_res = [l.strip().split()[-1] for l in codecs.open(nonexp_pred_name, 'r', 'utf-8')]
+                nonexpParser.print_features(rel, ['xxxxx'], nonexp_batch)
+        nonexp_res = self._classify('nonexp', nonexp_batch, nonexpParser.model_file)
 
         rid = 0
         for art in articles:
@@ -181,15 +170,14 @@ class DiscourseParser(object):
                 rel.sense = [pred_sense]
                 rid += 1
 
-        assert len(nonexp_res) == rid, 'nonexp relations size not match'
-
     def _post_process_nonexp_arguments(self, articles, which='test'):
         attrParser = Attribution()
-        attr_feat_name = FILE_PATH + '/../tmp/attr.feat'
-        attr_file = codecs.open(attr_feat_name, 'w', 'utf-8')
+        attr_batch = SparseBatch()
+        attr_checked = []
         for art in articles:
             for rel in art.nonexp_relations:
                 if rel.rel_type == 'Implicit':
+                    attr_checked.append((rel, len(attr_batch)))
                     s1_clauses = art.sentences[rel.arg1_sid].clauses
                     s2_clauses = art.sentences[rel.arg2_sid].clauses
 
@@ -197,75 +185,119 @@ class DiscourseParser(object):
                     for idx, clause in enumerate(s1_clauses):
                         prev_clause = s1_clauses[idx-1] if idx > 0 else None
                         next_clause = s1_clauses[idx+1] if idx < len(s1_clauses) -1 else None
-                        attrParser.print_features(clause, prev_clause, next_clause, rel.arg1_leaves, which, attr_file)
+                        attrParser.print_features(clause, prev_clause, next_clause, rel.arg1_leaves, which, attr_batch)
 
                     # for argument 2
                     for idx, clause in enumerate(s2_clauses):
                         prev_clause = s2_clauses[idx-1] if idx > 0 else None
                         next_clause = s2_clauses[idx+1] if idx < len(s2_clauses) -1 else None
-                        attrParser.print_features(clause, prev_clause, next_clause, rel.arg2_leaves, which, attr_file)
-        attr_file.close()
+                        attrParser.print_features(clause, prev_clause, next_clause, rel.arg2_leaves, which, attr_batch)
 
-        attr_pred_name = FILE_PATH + '/../tmp/attr.pred'
-        Corpus.test_with_opennlp(attr_feat_name, attrParser.model_file, attr_pred_name)
-        attr_res = [l.strip().split()[-1] for l in codecs.open(attr_pred_name, 'r', 'utf-8')]
+        attr_res = self._classify('attr', attr_batch, attrParser.model_file)
 
         # combine results
-        idx = 0
-        for art in articles:
-            for rel in art.nonexp_relations:
-                if rel.rel_type == 'Implicit':
-                    s1_clauses = art.sentences[rel.arg1_sid].clauses
-                    s2_clauses = art.sentences[rel.arg2_sid].clauses
-
-                    # for argument 1
-                    arg1_leaves = []
-                    for clause in s1_clauses:
-                        if len(clause) == 1 and is_punc(clause[0].parent_node.value):
-                            arg1_leaves += clause
-                        elif attr_res[idx] != '1':
-                            arg1_leaves += clause
-                        idx += 1
-
-                    rel.arg1_leaves = arg1_leaves
-
-                    # for argument 2
-                    arg2_leaves = []
-                    for clause in s2_clauses:
-                        if len(clause) == 1 and is_punc(clause[0].parent_node.value):
-                            arg2_leaves += clause
-                        elif attr_res[idx] != '1':
-                            arg2_leaves += clause
-                        idx += 1
-
-                    rel.arg2_leaves = arg2_leaves
-
-                    rel.arg1_leaves = self.remove_leading_tailing_punc(rel.arg1_leaves)
-                    rel.arg1_addr = [n.leaf_id for n in rel.arg1_leaves]
-                    rel.arg1_text = ' '.join(n.value for n in rel.arg1_leaves)
-
-                    rel.arg2_leaves = self.remove_leading_tailing_punc(rel.arg2_leaves)
-                    rel.arg2_addr = [n.leaf_id for n in rel.arg2_leaves]
-                    rel.arg2_text = ' '.join(n.value for n in rel.arg2_leaves)
-
-        assert len(attr_res) == idx, 'attrbution counts not match'
-
-    def parse(self, parse_path, raw_home, output):
+        for rel, idx in attr_checked:
+            art = rel.article
+            s1_clauses = art.sentences[rel.arg1_sid].clauses
+            s2_clauses = art.sentences[rel.arg2_sid].clauses
+
+            # for argument 1
+            arg1_leaves = []
+            for clause in s1_clauses:
+                if len(clause) == 1 and is_punc(clause[0].parent_node.value):
+                    arg1_leaves += clause
+                elif attr_res[idx] != '1':
+                    arg1_leaves += clause
+                idx += 1
+
+            rel.arg1_leaves = arg1_leaves
+
+            # for argument 2
+            arg2_leaves = []
+            for clause in s2_clauses:
+                if len(clause) == 1 and is_punc(clause[0].parent_node.value):
+                    arg2_leaves += clause
+                elif attr_res[idx] != '1':
+                    arg2_leaves += clause
+                idx += 1
+
+            rel.arg2_leaves = arg2_leaves
+
+            rel.arg1_leaves = self.remove_leading_tailing_punc(rel.arg1_leaves)
+            rel.arg1_addr = [n.leaf_id for n in rel.arg1_leaves]
+            rel.arg1_text = ' '.join(n.value for n in rel.arg1_leaves)
+
+            rel.arg2_leaves = self.remove_leading_tailing_punc(rel.arg2_leaves)
+            rel.arg2_addr = [n.leaf_id for n in rel.arg2_leaves]
+            rel.arg2_text = ' '.join(n.value for n in rel.arg2_leaves)
+
+    def parse(self, parse_path, raw_home, output, batch_size=None, workers=1):
         """
         @param parse_path: json format parse file
         @param raw_home: raw text home
+        @param batch_size: if set, documents are streamed through all stages this many
+        at a time and each batch is written as soon as it finishes
+        @param workers: number of processes parsing batches in parallel, results
+        are still written in doc id order
         """
-        which = 'test'
-        # TODO: connective identification
-        articles =[]
-        for art in Corpus.read_parses(parse_path):
+        if batch_size is None and workers <= 1:
+            articles = self._read_articles(Corpus.read_parses(parse_path), raw_home)
+            articles.sort(key=lambda x:x.id)
+            print >> logs, "===read data compelete==="
+            self._parse_articles(articles, output)
+            print >> logs, "===done.==="
+            return
+
+        index = sorted(ParseReader(parse_path).index())
+        if batch_size is None:
+            # a few batches per worker keeps the pool balanced
+            batch_size = max(1, int(math.ceil(len(index) / (workers * 4.0))))
+        batches = [index[start:start+batch_size] for start in range(0, len(index), batch_size)]
+        tasks = [(parse_path, raw_home, batch, number) for number, batch in enumerate(batches)]
+        pool = Pool(workers, _init_worker, (self.dump_home,)) if workers > 1 else None
+        try:
+            if pool is not None:
+                results = pool.imap(_parse_batch, tasks)
+            else:
+                results = (self._parse_batch(*task) for task in tasks)
+
+            done = 0
+            for batch, result in izip(batches, results):
+                output.write(result)
+                output.flush()
+                done += len(batch)
+                print >> logs, "===parsed %d of %d documents===" % (done, len(index))
+        finally:
+            if pool is not None:
+                # all results are in, or a batch failed and the other workers are stopped
+                pool.terminate()
+                pool.join()
+
+        print >> logs, "===done.==="
+
+    def _parse_batch(self, parse_path, raw_home, batch, number):
+        """
+        parse one batch of the sorted parse index, its dump files are prefixed with its number
+        :return: output json lines of the batch
+        """
+        self.dump_prefix = 'batch%d.' % number
+        articles = self._read_articles(Corpus.read_parses(parse_path, index=batch), raw_home)
+        output = cStringIO.StringIO()
+        self._parse_articles(articles, output)
+        return output.getvalue()
+
+    @staticmethod
+    def _read_articles(reader, raw_home):
+        articles = []
+        for art in reader:
             art.read_raw_text(raw_home+'/'+art.id)
             art.set_article_level_word_id()
             articles.append(art)
-        articles.sort(key=lambda x:x.id)
-
-        print >> logs, "===read data compelete==="
+        return articles
 
+    def _parse_articles(self, articles, output):
+        which = 'test'
+        # TODO: connective identification
         print >> logs, "===1. connective identification==="
         self._process_parsed_conn(articles, which)
 
@@ -293,8 +325,6 @@ class DiscourseParser(object):
                 if rel.rel_type != 'NoRel':
                     print >> output, rel.output_json_format()
 
-        print >> logs, "===done.==="
-
     def generate_nonexp_relations(self, article):
         for para in article.paragraphs:
             for s1, s2 in zip(para.sentences[:-1], para.sentences[1:]):
@@ -329,15 +359,31 @@ class DiscourseParser(object):
         else:
             return leaves
 
+_worker_parser = None
+
+
+def _init_worker(dump_home):
+    global _worker_parser
+    _worker_parser = DiscourseParser(dump_home)
+
+
+def _parse_batch(task):
+    return _worker_parser._parse_batch(*task)
+
+
 if __name__ == '__main__':
     arg_parser = argparse.ArgumentParser("Shallow Discourse Parser")
     arg_parser.add_argument('-c', '--input_home', help='test data home directory')
     arg_parser.add_argument('-o', '--output_home', help='output result home directory')
     arg_parser.add_argument('-r', '--result_name', help='output result file name')
+    arg_parser.add_argument('-d', '--dump_home', help='dump feature and prediction files of each stage here')
+    arg_parser.add_argument('-b', '--batch_size', help='stream documents through the parser in batches of this size',
+                            type=int)
+    arg_parser.add_argument('-w', '--workers', help='number of parsing processes', type=int, default=1)
     args = arg_parser.parse_args()
     # parse_path = args.input_home+'/pdtb-parses.json'
     # raw_path = args.input_home+'/raw'
     output_stream = codecs.open(args.output_home+'/'+args.result_name, 'w', 'utf-8')
-    dp = DiscourseParser()
-    dp.parse(DEV_PARSE_PATH, DEV_RAW_PATH, output_stream)
+    dp = DiscourseParser(args.dump_home)
+    dp.parse(DEV_PARSE_PATH, DEV_RAW_PATH, output_stream, args.batch_size, args.workers)
     output_stream.close()
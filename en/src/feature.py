@@ -6,7 +6,8 @@ import os
 from collections import defaultdict
 
 from deptree import DepTree
-from common import is_verb, cross_product
+from lexicon import compiled_table
+from common import is_verb, cross_product, CACHE_HOME
 
 FILE_PATH = os.path.dirname(__file__)
 
@@ -20,129 +21,158 @@ brown_cluster_path = FILE_PATH + '/../../lib/brown-c3200.txt'
 brown_rule_path = FILE_PATH + '/../../lib/mi-brown-c100.txt'
 
 
-class Feature(object):
+def _read_brown_cluster():
+    brown_cluster = defaultdict()
+    for line in open(brown_cluster_path):
+        cluster, word, _ = line.strip().split('\t')
+        brown_cluster[word] = cluster
+    return brown_cluster.items()
 
-    __slots__ = 'word_dict', 'rule_dict', 'dep_dict', 'levin_dict', 'mpqa_dict', 'neg_inq_dict', 'brown_cluster', 'brown_dict'
 
-    """
-    provide various methods to extact features
-    """
+def _read_scores(path, num=None):
+    """ the first num distinct keys of a "key ... score" list, in dict order """
+    scores = defaultdict(float)
+    count = 0
+    for line in open(path):
+        if count == num:
+            break
+        items = line.strip().split()
+        if items[0] not in scores:
+            scores[items[0]] = float(items[-1])
+            count += 1
+    return [(k, repr(v)) for k, v in scores.iteritems()]
 
-    def __init__(self):
-        self.load_init_lexicon()
 
-    def load_init_lexicon(self):
-        # load levin lexicon
-        # self._load_levin_lexicon()
+def _read_brown_rule():
+    return dict((k, float(v)) for k, v in _read_scores(brown_rule_path, 500))
 
-        # load mpqa lexicon
-        self._load_mpqa_lexicon()
 
-        # load inquier lexicon
-        self._load_inquirer_lexicon()
+def _read_word_pair():
+    return _read_scores(word_pair_path, 500)
 
-        # load production rule
-        self._load_production_rule()
 
-        # load dep rule
-        self._load_dependency_rule()
+def _read_production_rule():
+    return _read_scores(product_rule)
 
-        # load word pair dict
-        self._load_word_pair()
 
-        # load brown cluster
-        self._load_brown_cluster()
+def _read_dependency_rule():
+    return _read_scores(dep_rule)
 
-        # load brown cluster rule
-        # self._load_brown_rule()
 
-    def _load_brown_cluster(self):
-        self.brown_cluster = defaultdict()
-        for line in open(brown_cluster_path):
-            cluster, word, _ = line.strip().split('\t')
-            self.brown_cluster[word] = cluster
-
-    def _load_brown_rule(self, num=500):
-        self.brown_dict = defaultdict(float)
-        count = 0
-        for line in open(brown_rule_path):
-            if count == num:
-                break
-            items = line.strip().split()
-            if items[0] not in self.brown_dict:
-                self.brown_dict[items[0]] = float(items[-1])
-                count += 1
-
-    def _load_word_pair(self, num=500):
-        self.word_dict = defaultdict(float)
-        count = 0
-        for line in open(word_pair_path):
-            if count == num:
+def _read_levin_lexicon():
+    """ Example:
+    ;; Grid: 31.1.a#1#_ag_exp,instr(with)#abash#abash#abash#abash+ingly#(1.5,01020392)(1.6,01223592)###AD
+    """
+    levin_dict = defaultdict(set)
+    for line in open(levin_lcs):
+        line = line.strip()
+        if line.startswith(';; Grid:'):
+            item = line.split('#')
+            v_c = item[0].replace(';; Grid: ', '')
+            w = item[3]
+            levin_dict[w].add(v_c)
+    return levin_dict
+
+
+def _read_mpqa_lexicon():
+    """ Example:
+    type=weaksubj len=1 word1=abandoned pos1=adj stemmed1=n priorpolarity=negative
+    """
+    mpqa_dict = {}
+    for line in open(mpqa_sub_path):
+        item = line.strip().split()
+        w = item[2].replace('word1=', '')
+        p = item[-1].replace('priorpolarity=', '')
+        mpqa_dict[w] = p
+    return mpqa_dict.items()
+
+
+def _read_inquirer_lexicon():
+    """Example:
+    ABANDON H4Lvd Neg Ngtv Weak Fail IAV AFFLOSS AFFTOT SUPV  |
+    """
+    neg_inq_dict = set()
+    for idx, line in enumerate(open(inquirer_lex)):
+        if idx == 0:
+            continue
+        item = line.strip().split()
+        for it in item:
+            if it == 'Neg':
+                neg_inq_dict.add(item[0].lower().split('#')[0])
                 break
-            items = line.strip().split()
-            if items[0] not in self.word_dict:
-                self.word_dict[items[0]] = float(items[-1])
-                count += 1
-
-    def _load_production_rule(self, num=100):
-        self.rule_dict = defaultdict(float)
-        count = 0
-        for line in open(product_rule):
-            # if count == num:
-            #     break
-            items = line.strip().split()
-            if items[0] not in self.rule_dict:
-                self.rule_dict[items[0]] = float(items[-1])
-                count += 1
-
-    def _load_dependency_rule(self, num=100):
-        self.dep_dict = defaultdict(float)
-        count = 0
-        for line in open(dep_rule):
-            # if count == num:
-            #     break
-            items = line.strip().split()
-            if items[0] not in self.dep_dict:
-                self.dep_dict[items[0]] = float(items[-1])
-                count += 1
-
-    def _load_levin_lexicon(self):
-        """ Example:
-        ;; Grid: 31.1.a#1#_ag_exp,instr(with)#abash#abash#abash#abash+ingly#(1.5,01020392)(1.6,01223592)###AD
-        """
-        self.levin_dict = defaultdict(set)
-        for line in open(levin_lcs):
-            line = line.strip()
-            if line.startswith(';; Grid:'):
-                item = line.split('#')
-                v_c = item[0].replace(';; Grid: ', '')
-                w = item[3]
-                self.levin_dict[w].add(v_c)
-
-    def _load_mpqa_lexicon(self):
-        """ Example:
-        type=weaksubj len=1 word1=abandoned pos1=adj stemmed1=n priorpolarity=negative
-        """
-        self.mpqa_dict = {}
-        for line in open(mpqa_sub_path):
-            item = line.strip().split()
-            w = item[2].replace('word1=', '')
-            p = item[-1].replace('priorpolarity=', '')
-            self.mpqa_dict[w] = p
-
-    def _load_inquirer_lexicon(self):
-        """Example:
-        ABANDON H4Lvd Neg Ngtv Weak Fail IAV AFFLOSS AFFTOT SUPV  |
-        """
-        self.neg_inq_dict = set()
-        for idx, line in enumerate(open(inquirer_lex)):
-            if idx == 0:
-                continue
-            item = line.strip().split()
-            for it in item:
-                if it == 'Neg':
-                    self.neg_inq_dict.add(item[0].lower().split('#')[0])
-                    break
+    return [(w, '') for w in neg_inq_dict]
+
+
+def _read_word_pair_index():
+    """ stem1 -> [(stem2, pair)] of the word pairs, stems may contain '_' so every split is listed """
+    word_pair_index = defaultdict(list)
+    for pair in _lexicon('word_dict'):
+        for i, c in enumerate(pair):
+            if c == '_':
+                word_pair_index[pair[:i]].append((pair[i+1:], pair))
+    return word_pair_index
+
+
+# lexicons compiled into string tables: the values are str, scores are kept as repr(float)
+_compiled_lexicons = {
+    'brown_cluster': (brown_cluster_path, _read_brown_cluster),
+    'word_dict': (word_pair_path, _read_word_pair),
+    'rule_dict': (product_rule, _read_production_rule),
+    'dep_dict': (dep_rule, _read_dependency_rule),
+    'mpqa_dict': (mpqa_sub_path, _read_mpqa_lexicon),
+    'neg_inq_dict': (inquirer_lex, _read_inquirer_lexicon),
+}
+
+# the rest stay python objects
+_memory_lexicons = {
+    'brown_dict': _read_brown_rule,
+    'levin_dict': _read_levin_lexicon,
+    'word_pair_index': _read_word_pair_index,
+}
+
+_lexicons = {}
+
+
+def _lexicon(name):
+    """ loaded on first use, then shared by all the Feature objects of the process """
+    if name not in _lexicons:
+        if name in _compiled_lexicons:
+            path, read = _compiled_lexicons[name]
+            _lexicons[name] = compiled_table(name, path, read, CACHE_HOME)
+        else:
+            _lexicons[name] = _memory_lexicons[name]()
+    return _lexicons[name]
+
+
+def _lexicon_property(name):
+    return property(lambda self: _lexicon(name))
+
+
+class Feature(object):
+
+    __slots__ = ()
+
+    """
+    provide various methods to extact features, each lexicon is loaded when
+    a feature first needs it
+    """
+
+    word_dict = _lexicon_property('word_dict')
+    rule_dict = _lexicon_property('rule_dict')
+    dep_dict = _lexicon_property('dep_dict')
+    levin_dict = _lexicon_property('levin_dict')
+    mpqa_dict = _lexicon_property('mpqa_dict')
+    neg_inq_dict = _lexicon_property('neg_inq_dict')
+    brown_cluster = _lexicon_property('brown_cluster')
+    brown_dict = _lexicon_property('brown_dict')
+    word_pair_index = _lexicon_property('word_pair_index')
+
+    @staticmethod
+    def load_init_lexicon():
+        """ load the lexicons of the default features now, e.g. before forking workers """
+        for name in ['mpqa_dict', 'neg_inq_dict', 'rule_dict', 'dep_dict', 'word_dict',
+                     'word_pair_index', 'brown_cluster']:
+            _lexicon(name)
 
     @staticmethod
     def extract_first_last(rel):
@@ -345,14 +375,23 @@ class Feature(object):
             else:
                 n.get_production_rules(res2, -1)
 
+        return self._rule_features(self.rule_dict, res1, res2)
+
+    @staticmethod
+    def _rule_features(lexicon, res1, res2):
+        """
+        the rules of the two arguments found in a rule lexicon, in the order
+        of the lexicon as if all of it was scanned
+        """
         feat_vec = []
-        for k in self.rule_dict:
+        found = set(lexicon.find(k) for k in res1.keys() + res2.keys())
+        found.discard(-1)
+        for k in [lexicon.key(i) for i in sorted(found)]:
             a1 = k in res1
             a2 = k in res2
             if a1: feat_vec.append(k + ":1")
             if a2: feat_vec.append(k + ":2")
             if a1 and a2: feat_vec.append(k + ":12")
-
         return feat_vec
 
     def extract_dependency_rules(self, relation):
@@ -366,15 +405,7 @@ class Feature(object):
         DepTree.get_dependency_rules(res1, relation.arg1_leaves, False, True)
         DepTree.get_dependency_rules(res2, relation.arg2_leaves, False, True)
 
-        feat_vec = []
-        for k in self.dep_dict:
-            a1 = k in res1
-            a2 = k in res2
-            if a1: feat_vec.append(k + ":1")
-            if a2: feat_vec.append(k + ":2")
-            if a1 and a2: feat_vec.append(k + ":12")
-
-        return feat_vec
+        return self._rule_features(self.dep_dict, res1, res2)
 
     def extract_arg2_first3(self, relation):
         """
@@ -387,23 +418,26 @@ class Feature(object):
         return feat_vec
 
     def extract_word_pair(self, rel):
+        # the pairs are only looked up for distinct stems, and added to the set
+        # in the order the loop over all leaf pairs would first meet them
+        arg2_rank = dict((s2, i) for i, s2 in enumerate(_distinct(w.stem for w in rel.arg2_leaves)))
         tmp = set()
-        for w1 in rel.arg1_leaves:
-            for w2 in rel.arg2_leaves:
-                k = w1.stem + "_" + w2.stem
-                if k in self.word_dict:
-                    tmp.add(k)
+        for s1 in _distinct(w.stem for w in rel.arg1_leaves):
+            found = [(arg2_rank[s2], s2) for s2, _ in self.word_pair_index.get(s1, []) if s2 in arg2_rank]
+            for _, s2 in sorted(found):
+                tmp.add(s1 + "_" + s2)
 
         return ["%s:1" % k for k in tmp]
 
     def extract_brown_cluster(self, rel):
+        # each distinct word is looked up once, the lexicon is a string table
+        clusters1 = _distinct(self.brown_cluster.get(w, 'nil') for w in _distinct(w.value for w in rel.arg1_leaves))
+        clusters2 = _distinct(self.brown_cluster.get(w, 'nil') for w in _distinct(w.value for w in rel.arg2_leaves))
         tmp = set()
-        for w1 in rel.arg1_leaves:
-            for w2 in rel.arg2_leaves:
-                k = 'b:'+self.brown_cluster.get(w1.value, 'nil') + '_b:' \
-                        + self.brown_cluster.get(w2.value, 'nil')
+        for c1 in clusters1:
+            for c2 in clusters2:
                 # if k in self.brown_dict:
-                tmp.add(k)
+                tmp.add('b:' + c1 + '_b:' + c2)
 
         return ["%s:1" % k for k in tmp]
 
@@ -436,3 +470,14 @@ class Feature(object):
         if rel[1] == 'Explicit':
             res.append('arg2_conn:%s' % '_'.join(n.value.lower() for n in rel.conn_leaves))
         return res
+
+
+def _distinct(values):
+    """ the distinct values in the order of their first occurrence """
+    seen = set()
+    res = []
+    for v in values:
+        if v not in seen:
+            seen.add(v)
+            res.append(v)
+    return res
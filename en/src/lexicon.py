@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Read-only string tables for the lexicons of Feature. A lexicon is compiled
+once into a file that every process memory-maps, so its pages are shared
+through the page cache and opening it parses nothing.
+"""
+import os
+import mmap
+import zlib
+import struct
+import inspect
+import hashlib
+
+_MAGIC = 'LEX1'
+_header = struct.Struct('<4sII')  # magic, number of entries, number of hash slots
+_uint = struct.Struct('<I')
+_pair = struct.Struct('<II')
+
+
+class StringTable(object):
+    """
+    str -> str mapping whose i-th entry is the i-th pair it was compiled from
+
+    layout: header, hash slots (entry + 1, 0 for empty, linear probing on the
+    crc32 of the key), 2 * entries + 1 offsets (key i starts at offsets[2i],
+    its value at offsets[2i+1] and ends before offsets[2i+2]), strings
+    """
+    __slots__ = ('buf', 'size', 'mask', 'slots', 'offsets', 'strings')
+
+    def __init__(self, buf):
+        magic, self.size, num_slots = _header.unpack_from(buf, 0)
+        if magic != _MAGIC:
+            raise ValueError('not a compiled lexicon')
+        self.buf = buf
+        self.mask = num_slots - 1
+        self.slots = _header.size
+        self.offsets = self.slots + 4 * num_slots
+        self.strings = self.offsets + 4 * (2 * self.size + 1)
+
+    @staticmethod
+    def compile(pairs):
+        """ :param pairs: [(key, value), ...] of str, keys are distinct """
+        pairs = list(pairs)
+        num_slots = 1
+        while num_slots < 2 * len(pairs):
+            num_slots *= 2
+        slots = [0] * num_slots
+        offsets = []
+        strings = []
+        pos = 0
+        for i, (key, value) in enumerate(pairs):
+            h = zlib.crc32(key) & (num_slots - 1)
+            while slots[h] != 0:
+                h = (h + 1) & (num_slots - 1)
+            slots[h] = i + 1
+            offsets += [pos, pos + len(key)]
+            strings += [key, value]
+            pos += len(key) + len(value)
+        offsets.append(pos)
+        return ''.join([_header.pack(_MAGIC, len(pairs), num_slots),
+                        struct.pack('<%dI' % num_slots, *slots),
+                        struct.pack('<%dI' % len(offsets), *offsets)] + strings)
+
+    @staticmethod
+    def open(path):
+        with open(path, 'rb') as f:
+            return StringTable(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def __len__(self):
+        return self.size
+
+    def key(self, i):
+        begin, end = _pair.unpack_from(self.buf, self.offsets + 8 * i)
+        return self.buf[self.strings + begin:self.strings + end]
+
+    def value(self, i):
+        begin, end = _pair.unpack_from(self.buf, self.offsets + 8 * i + 4)
+        return self.buf[self.strings + begin:self.strings + end]
+
+    def find(self, key):
+        """ the entry of key, -1 if absent """
+        if isinstance(key, unicode):
+            # as in a dict of str keys, only ascii unicode finds its str
+            try:
+                key = key.encode('ascii')
+            except UnicodeEncodeError:
+                return -1
+        h = zlib.crc32(key) & self.mask
+        while True:
+            i = _uint.unpack_from(self.buf, self.slots + 4 * h)[0] - 1
+            if i == -1 or self.key(i) == key:
+                return i
+            h = (h + 1) & self.mask
+
+    def __contains__(self, key):
+        return self.find(key) != -1
+
+    def __getitem__(self, key):
+        i = self.find(key)
+        if i == -1:
+            raise KeyError(key)
+        return self.value(i)
+
+    def get(self, key, default=None):
+        i = self.find(key)
+        return self.value(i) if i != -1 else default
+
+    def __iter__(self):
+        for i in xrange(self.size):
+            yield self.key(i)
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def compiled_table(name, source_path, read, cache_home):
+    """
+    the StringTable of a lexicon, compiled from read() -> [(key, value), ...]
+    into cache_home, keyed by the source file and the module of read, or kept
+    in memory when cache_home is None
+    """
+    if cache_home is None:
+        return StringTable(StringTable.compile(read()))
+    key = hashlib.sha1(_MAGIC + file_digest(source_path) + inspect.getsource(inspect.getmodule(read))).hexdigest()
+    path = '%s/lexicon-%s-%s.tbl' % (cache_home, name, key)
+    if not os.path.exists(path):
+        if not os.path.isdir(cache_home):
+            os.makedirs(cache_home)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(StringTable.compile(read()))
+        os.rename(tmp_path, path)
+    return StringTable.open(path)
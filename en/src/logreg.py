@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+"""
+Multinomial logistic regression trained on the rows of a SparseBatch with
+L-BFGS, or OWL-QN when there is an L1 penalty. The model is written as a GIS
+model whose correction parameter is 0, with the intercepts of the outcomes
+on the maxent.BIAS predicate, which maxent.GISModel adds to every event
+
+The loss is computed with sparse matrix products when numpy and scipy are
+installed, and in plain python over row chunks in forked processes otherwise
+"""
+import sys
+import math
+import time
+import codecs
+import ctypes
+from array import array
+from itertools import imap, izip, islice
+from multiprocessing import Pool, RawArray, cpu_count
+
+try:
+    import numpy
+    import scipy.sparse
+except ImportError:
+    numpy = None
+
+from maxent import BIAS
+from sparse import SparseBatch
+
+logs = sys.stderr
+
+# (batch, outcome id of each row, number of outcomes, weights, chunks),
+# set before the gradient workers fork so that they share it
+_shared = None
+
+
+def _read(shared):
+    res = array('d')
+    res.fromstring(ctypes.string_at(shared, ctypes.sizeof(shared)))
+    return res
+
+
+def _write(shared, values):
+    ctypes.memmove(shared, values.buffer_info()[0], ctypes.sizeof(shared))
+
+
+def _gradient(batch, begin, end, indices, shift, outcome_ids, num_outcomes, w, g):
+    """
+    negative log likelihood of rows [begin, end), its gradient is added to g
+    :param indices: column of each value of the rows, the j-th value of the
+    batch is at indices[j - shift]; the weights of column c are at
+    w[c * num_outcomes:], the intercepts are the last ones
+    """
+    indptr, data = batch.indptr, batch.data
+    outcomes = range(num_outcomes)
+    bias = len(w) - num_outcomes
+    loss = 0.0
+    for r in xrange(begin, end):
+        row = xrange(indptr[r], indptr[r+1])
+        scores = [w[bias + o] for o in outcomes]
+        for j in row:
+            base = indices[j - shift] * num_outcomes
+            value = data[j]
+            for o in outcomes:
+                scores[o] += w[base + o] * value
+        top = max(scores)
+        exps = [math.exp(s - top) for s in scores]
+        normal = sum(exps)
+        y = outcome_ids[r]
+        loss += top + math.log(normal) - scores[y]
+        # d loss / d score = probability - gold
+        delta = [p / normal for p in exps]
+        delta[y] -= 1.0
+        for o in outcomes:
+            g[bias + o] += delta[o]
+        for j in row:
+            base = indices[j - shift] * num_outcomes
+            value = data[j]
+            for o in outcomes:
+                g[base + o] += delta[o] * value
+    return loss
+
+
+def _renumber(batch, begin, end):
+    """
+    :return: (column of each value of rows [begin, end) numbered from 0 in
+    order of first use, the batch column of each of those numbers)
+    """
+    local = {}
+    columns = []
+    indices = array('i')
+    for c in islice(batch.indices, batch.indptr[begin], batch.indptr[end]):
+        if c not in local:
+            local[c] = len(columns)
+            columns.append(c)
+        indices.append(local[c])
+    return indices, columns
+
+
+def _chunk_gradient(k):
+    """
+    negative log likelihood of the k-th chunk of rows under the shared
+    weights, the gradient of the columns it uses and of the intercepts goes
+    to the shared gradient of the chunk
+    """
+    batch, outcome_ids, num_outcomes, weights, chunks = _shared
+    begin, end, indices, columns, gradient = chunks[k]
+    w = array('d')
+    for c in columns:
+        w.extend(weights[c * num_outcomes:(c + 1) * num_outcomes])
+    w.extend(weights[len(weights) - num_outcomes:])
+    g = array('d', [0.0]) * len(w)
+    loss = _gradient(batch, begin, end, indices, batch.indptr[begin], outcome_ids, num_outcomes, w, g)
+    _write(gradient, g)
+    return loss
+
+
+class _PythonLoss(object):
+    """
+    negative log likelihood of a batch and its gradient in plain python, with
+    more than one worker the rows are split in chunks that forked processes
+    compute over the columns they use
+    """
+    __slots__ = ('batch', 'outcome_ids', 'num_outcomes', 'weights', 'chunks', 'pool')
+
+    def __init__(self, batch, outcome_ids, num_outcomes, size, workers):
+        global _shared
+        self.batch = batch
+        self.outcome_ids = outcome_ids
+        self.num_outcomes = num_outcomes
+        self.pool = None
+        if workers > 1:
+            bounds = [len(batch) * k // workers for k in range(workers + 1)]
+            self.weights = RawArray('d', size)
+            self.chunks = []
+            for begin, end in zip(bounds, bounds[1:]):
+                indices, columns = _renumber(batch, begin, end)
+                gradient = RawArray('d', (len(columns) + 1) * num_outcomes)
+                self.chunks.append((begin, end, indices, columns, gradient))
+            _shared = (batch, outcome_ids, num_outcomes, self.weights, self.chunks)
+            self.pool = Pool(workers)
+
+    def __call__(self, w):
+        g = array('d', [0.0]) * len(w)
+        if self.pool is None:
+            loss = _gradient(self.batch, 0, len(self.batch), self.batch.indices, 0,
+                             self.outcome_ids, self.num_outcomes, w, g)
+            return loss, g
+        _write(self.weights, w)
+        losses = self.pool.map(_chunk_gradient, range(len(self.chunks)))
+        num_outcomes = self.num_outcomes
+        bias = len(w) // num_outcomes - 1
+        for _, _, _, columns, gradient in self.chunks:
+            chunk_g = _read(gradient)
+            for j, c in enumerate(columns + [bias]):
+                base, local = c * num_outcomes, j * num_outcomes
+                for o in range(num_outcomes):
+                    g[base + o] += chunk_g[local + o]
+        return sum(losses), g
+
+    def close(self):
+        global _shared
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        _shared = None
+
+
+class _NumpyLoss(object):
+    """ negative log likelihood of a batch and its gradient as sparse matrix products """
+    __slots__ = ('rows', 'outcome_ids', 'num_outcomes')
+
+    def __init__(self, batch, outcome_ids, num_outcomes):
+        data = numpy.frombuffer(batch.data, numpy.float32).astype(numpy.float64)
+        indices = numpy.frombuffer(batch.indices, numpy.intc)
+        indptr = numpy.frombuffer(batch.indptr, numpy.intc)
+        self.rows = scipy.sparse.csr_matrix((data, indices, indptr), shape=(len(batch), len(batch.index)))
+        self.outcome_ids = numpy.frombuffer(outcome_ids, numpy.intc)
+        self.num_outcomes = num_outcomes
+
+    def __call__(self, w):
+        num_outcomes = self.num_outcomes
+        scores = self.rows.dot(w[:-num_outcomes].reshape(-1, num_outcomes)) + w[-num_outcomes:]
+        gold = (numpy.arange(len(scores)), self.outcome_ids)
+        top = scores.max(1)
+        exps = numpy.exp(scores - top[:, None])
+        normal = exps.sum(1)
+        loss = float((top + numpy.log(normal) - scores[gold]).sum())
+        # d loss / d score = probability - gold
+        delta = exps / normal[:, None]
+        delta[gold] -= 1.0
+        g = numpy.empty_like(w)
+        g[:-num_outcomes] = self.rows.T.dot(delta).ravel()
+        g[-num_outcomes:] = delta.sum(0)
+        return loss, g
+
+    def close(self):
+        pass
+
+
+class _ArrayVectors(object):
+    """
+    vector arithmetic of the minimizer on array('d'), the l1 penalty and the
+    orthants only concern the first n weights
+    """
+
+    @staticmethod
+    def zeros(size):
+        return array('d', [0.0]) * size
+
+    @staticmethod
+    def to_array(a):
+        return a
+
+    @staticmethod
+    def dot(a, b):
+        return sum(imap(float.__mul__, a, b))
+
+    @staticmethod
+    def add(a, b, alpha):
+        """ a + alpha * b """
+        return array('d', imap(lambda ai, bi: ai + alpha * bi, a, b))
+
+    @staticmethod
+    def scale(a, alpha):
+        return array('d', imap(lambda ai: ai * alpha, a))
+
+    @staticmethod
+    def add_head(a, b, alpha, n):
+        """ a + alpha * b on the first n, a elsewhere """
+        res = array('d', imap(lambda ai, bi: ai + alpha * bi, a, islice(b, n)))
+        res.extend(islice(a, n, None))
+        return res
+
+    @staticmethod
+    def abs_sum(a, n):
+        return sum(imap(abs, islice(a, n)))
+
+    @staticmethod
+    def pseudo_gradient(w, g, l1, n):
+        """ the steepest descent direction of the l1 penalized loss, negated """
+        if l1 == 0:
+            return g
+        pg = array('d', g)
+        for i, (wi, gi) in enumerate(islice(izip(w, g), n)):
+            if wi > 0:
+                pg[i] = gi + l1
+            elif wi < 0:
+                pg[i] = gi - l1
+            elif gi + l1 < 0:
+                pg[i] = gi + l1
+            elif gi - l1 > 0:
+                pg[i] = gi - l1
+            else:
+                pg[i] = 0.0
+        return pg
+
+    @staticmethod
+    def orthant(w, pg, n):
+        """ sign of each weight, of the descent direction where it is 0 """
+        return array('d', imap(lambda wi, pi: (wi > 0) - (wi < 0) if wi != 0 else (pi < 0) - (pi > 0),
+                               islice(w, n), pg))
+
+    @staticmethod
+    def project(w, orthant, n):
+        """ the weights that left their orthant set to 0 """
+        res = array('d', imap(lambda wi, oi: wi if wi * oi > 0 else 0.0, w, orthant))
+        res.extend(islice(w, n, None))
+        return res
+
+    @staticmethod
+    def constrain(d, pg, n):
+        """ the direction kept to the orthant the pseudo gradient points to """
+        res = array('d', imap(lambda di, pi: di if di * pi < 0 else 0.0, islice(d, n), pg))
+        res.extend(islice(d, n, None))
+        return res
+
+
+class _NumpyVectors(object):
+    """ the arithmetic of _ArrayVectors on numpy arrays """
+
+    @staticmethod
+    def zeros(size):
+        return numpy.zeros(size)
+
+    @staticmethod
+    def to_array(a):
+        return array('d', a.tolist())
+
+    @staticmethod
+    def dot(a, b):
+        return float(numpy.dot(a, b))
+
+    @staticmethod
+    def add(a, b, alpha):
+        return a + alpha * b
+
+    @staticmethod
+    def scale(a, alpha):
+        return a * alpha
+
+    @staticmethod
+    def add_head(a, b, alpha, n):
+        res = a.copy()
+        res[:n] += alpha * b[:n]
+        return res
+
+    @staticmethod
+    def abs_sum(a, n):
+        return float(numpy.abs(a[:n]).sum())
+
+    @staticmethod
+    def pseudo_gradient(w, g, l1, n):
+        if l1 == 0:
+            return g
+        wh, gh = w[:n], g[:n]
+        pg = g.copy()
+        pg[:n] = numpy.where(wh > 0, gh + l1, numpy.where(wh < 0, gh - l1, numpy.where(
+            gh + l1 < 0, gh + l1, numpy.where(gh - l1 > 0, gh - l1, 0.0))))
+        return pg
+
+    @staticmethod
+    def orthant(w, pg, n):
+        return numpy.where(w[:n] != 0, numpy.sign(w[:n]), -numpy.sign(pg[:n]))
+
+    @staticmethod
+    def project(w, orthant, n):
+        res = w.copy()
+        res[:n][res[:n] * orthant <= 0] = 0.0
+        return res
+
+    @staticmethod
+    def constrain(d, pg, n):
+        res = d.copy()
+        res[:n][res[:n] * pg[:n] >= 0] = 0.0
+        return res
+
+
+class LogisticRegression(object):
+    """
+    weights of each (feature, outcome) and the intercept of each outcome, the
+    weight of column c for outcome o is at c * len(outcomes) + o, the
+    intercepts come after the columns of the index
+    """
+    __slots__ = ('outcomes', 'index', 'weights')
+
+    def __init__(self, outcomes, index, weights):
+        self.outcomes = outcomes
+        self.index = index
+        self.weights = weights
+
+    @staticmethod
+    def train(batch, l1=0.0, l2=1.0, iterations=100, workers=None, tolerance=1e-4, memory=10):
+        """
+        minimize the negative log likelihood of the batch + l2 / 2 * |w|^2 + l1 * |w|_1,
+        the intercepts are not penalized
+        :param workers: processes computing the gradient without numpy, all cores by default
+        """
+        outcomes = sorted(set(batch.labels))
+        outcome_index = dict((o, oid) for oid, o in enumerate(outcomes))
+        outcome_ids = array('i', [outcome_index[l] for l in batch.labels])
+        penalized = len(batch.index) * len(outcomes)
+        size = penalized + len(outcomes)
+
+        if numpy is not None:
+            vectors = _NumpyVectors
+            loss = _NumpyLoss(batch, outcome_ids, len(outcomes))
+        else:
+            if workers is None:
+                workers = cpu_count()
+            vectors = _ArrayVectors
+            loss = _PythonLoss(batch, outcome_ids, len(outcomes), size, max(1, min(workers, len(batch))))
+
+        def objective(w):
+            """ loss and gradient without the l1 penalty """
+            value, g = loss(w)
+            if l2 > 0:
+                head = w[:penalized]
+                value += 0.5 * l2 * vectors.dot(head, head)
+                g = vectors.add_head(g, w, l2, penalized)
+            return value, g
+
+        # the intercepts start at the log priors of the outcomes, the optimum while the other weights are 0
+        w = vectors.zeros(size)
+        for oid, o in enumerate(outcomes):
+            w[penalized + oid] = math.log(batch.labels.count(o) / float(len(batch)))
+        try:
+            w = LogisticRegression._minimize(objective, vectors, w, penalized, l1, iterations, tolerance, memory)
+        finally:
+            loss.close()
+        return LogisticRegression(outcomes, batch.index, vectors.to_array(w))
+
+    @staticmethod
+    def _minimize(objective, vectors, w, penalized, l1, iterations, tolerance, memory):
+        """
+        OWL-QN, which is L-BFGS when l1 is 0, from the weights w whose first
+        `penalized' ones have the l1 penalty
+        """
+        loss, g = objective(w)
+        penalty = l1 * vectors.abs_sum(w, penalized) if l1 > 0 else 0.0
+        history = []  # (s, y, 1 / y.s) of the last `memory' steps
+        for it in range(iterations):
+            pg = vectors.pseudo_gradient(w, g, l1, penalized)
+            pg_norm = math.sqrt(vectors.dot(pg, pg))
+            if pg_norm < 1e-10:
+                break
+
+            # two loop recursion, direction = -H pg
+            d = vectors.scale(pg, 1.0)
+            alphas = []
+            for s, y, rho in reversed(history):
+                alpha = rho * vectors.dot(s, d)
+                d = vectors.add(d, y, -alpha)
+                alphas.append(alpha)
+            if len(history) > 0:
+                s, y, rho = history[-1]
+                d = vectors.scale(d, 1.0 / (rho * vectors.dot(y, y)))
+            for (s, y, rho), alpha in izip(history, reversed(alphas)):
+                beta = rho * vectors.dot(y, d)
+                d = vectors.add(d, s, alpha - beta)
+            d = vectors.scale(d, -1.0)
+            if l1 > 0:
+                # stay in the orthant the pseudo gradient points to
+                d = vectors.constrain(d, pg, penalized)
+            if vectors.dot(pg, d) >= 0:
+                history = []
+                d = vectors.scale(pg, -1.0)
+
+            # backtracking line search
+            if l1 > 0:
+                orthant = vectors.orthant(w, pg, penalized)
+            step = 1.0 if len(history) > 0 else 1.0 / pg_norm
+            for _ in range(30):
+                new_w = vectors.add(w, d, step)
+                if l1 > 0:
+                    new_w = vectors.project(new_w, orthant, penalized)
+                new_loss, new_g = objective(new_w)
+                new_penalty = l1 * vectors.abs_sum(new_w, penalized) if l1 > 0 else 0.0
+                if new_loss + new_penalty <= loss + penalty + 1e-4 * vectors.dot(pg, vectors.add(new_w, w, -1.0)):
+                    break
+                step *= 0.5
+            else:
+                print >> logs, 'line search failed at iteration %d' % it
+                break
+
+            s = vectors.add(new_w, w, -1.0)
+            y = vectors.add(new_g, g, -1.0)
+            sy = vectors.dot(s, y)
+            if sy > 1e-10:
+                history.append((s, y, 1.0 / sy))
+                if len(history) > memory:
+                    history.pop(0)
+
+            improvement = (loss + penalty - new_loss - new_penalty) / max(1.0, abs(new_loss + new_penalty))
+            w, loss, g, penalty = new_w, new_loss, new_g, new_penalty
+            print >> logs, 'iteration %d: loss %.4f, step %g' % (it + 1, loss + penalty, step)
+            if improvement < tolerance:
+                break
+        return w
+
+    def save(self, model_path):
+        """
+        plain text GIS model, see opennlp.maxent.io.GISModelWriter, only the
+        (feature, outcome) pairs of nonzero weight are kept
+        """
+        num_outcomes = len(self.outcomes)
+        patterns = {}
+        order = []
+        for c, name in enumerate(self.index.names + [BIAS]):
+            params = self.weights[c * num_outcomes:(c + 1) * num_outcomes]
+            pattern = tuple(o for o in range(num_outcomes) if params[o] != 0)
+            if len(pattern) == 0:
+                continue
+            if pattern not in patterns:
+                patterns[pattern] = []
+                order.append(pattern)
+            patterns[pattern].append((name, [params[o] for o in pattern]))
+
+        to_file = codecs.open(model_path, 'w', 'utf-8')
+        lines = ['GIS', '1', '0.0', str(num_outcomes)] + list(self.outcomes)
+        lines.append(str(len(order)))
+        lines += [' '.join(str(x) for x in (len(patterns[p]),) + p) for p in order]
+        lines.append(str(sum(len(patterns[p]) for p in order)))
+        lines += [name for p in order for name, _ in patterns[p]]
+        lines += [repr(v) for p in order for _, params in patterns[p] for v in params]
+        for line in lines:
+            to_file.write(line + '\n')
+        to_file.close()
+
+
+def read_batch(train_file):
+    """ rows of a conll.*.train file """
+    batch = SparseBatch()
+    for line in codecs.open(train_file, 'r', 'utf-8'):
+        batch.write(line)
+    return batch
+
+
+def train_model(train_file, model_file, l1=0.0, l2=1.0, iterations=100, workers=None):
+    start = time.time()
+    batch = read_batch(train_file)
+    print >> logs, 'read %d instances, %d features: %s' % (len(batch), len(batch.index), train_file)
+    model = LogisticRegression.train(batch, l1, l2, iterations, workers)
+    model.save(model_file)
+    print >> logs, 'trained %s in %.1f sec' % (model_file, time.time() - start)
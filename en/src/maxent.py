@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+__author__ = 'Sheng Li'
+
+import os
+import sys
+import math
+import gzip
+import codecs
+import struct
+
+logs = sys.stderr
+
+_float32 = struct.Struct('>f')
+_int32 = struct.Struct('>i')
+_ushort = struct.Struct('>H')
+_double = struct.Struct('>d')
+
+# predicate of the intercepts of the models written by logreg.py, active in
+# every event; contexts are split on blanks, so no feature is named like it
+BIAS = 'bias '
+
+
+class _PlainTextModelReader(object):
+    """ one value per line, see opennlp.maxent.io.PlainTextGISModelReader """
+    __slots__ = ('stream',)
+
+    def __init__(self, stream):
+        self.stream = codecs.getreader('utf-8')(stream)
+
+    def read_utf(self):
+        return self.stream.readline().rstrip('\r\n')
+
+    def read_int(self):
+        return int(self.read_utf())
+
+    def read_double(self):
+        return float(self.read_utf())
+
+
+class _BinaryModelReader(object):
+    """ java DataInputStream encoding, see opennlp.maxent.io.BinaryGISModelReader """
+    __slots__ = ('stream',)
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def read_utf(self):
+        length = _ushort.unpack(self.stream.read(2))[0]
+        return self.stream.read(length).decode('utf-8', 'replace')
+
+    def read_int(self):
+        return _int32.unpack(self.stream.read(4))[0]
+
+    def read_double(self):
+        return _double.unpack(self.stream.read(8))[0]
+
+
+class GISModel(object):
+    """
+    Pure python scorer for the GIS models written by eval/CreateModel.java,
+    gives the same outcome distributions as eval/Predict.java; the BIAS
+    predicate of a model, if any, is added to every event
+    """
+    __slots__ = ('outcomes', 'pred_index', 'params', 'correction_constant', 'correction_param',
+                 'constant_inverse', 'bias')
+
+    def __init__(self, model_path):
+        reader = self._open(model_path)
+        model_type = reader.read_utf()
+        if model_type != 'GIS':
+            print >> logs, 'Error: attempting to load a %s model as a GIS model.' % model_type
+        self.correction_constant = reader.read_int()
+        self.correction_param = reader.read_double()
+        self.constant_inverse = 1.0 / self.correction_constant
+
+        self.outcomes = [reader.read_utf() for _ in range(reader.read_int())]
+        patterns = [[int(x) for x in reader.read_utf().split(' ')] for _ in range(reader.read_int())]
+        pred_labels = [reader.read_utf() for _ in range(reader.read_int())]
+        self.pred_index = dict((p, pid) for pid, p in enumerate(pred_labels))
+        self.bias = self.pred_index.get(BIAS)
+
+        # each pattern is "<number of predicates> <outcome id> <outcome id> ...",
+        # predicates are stored grouped by the pattern they share
+        self.params = []
+        for pattern in patterns:
+            outcome_ids = tuple(pattern[1:])
+            for _ in range(pattern[0]):
+                self.params.append((outcome_ids, tuple(reader.read_double() for _ in outcome_ids)))
+        reader.stream.close()
+
+    @staticmethod
+    def _open(model_path):
+        """ same suffix convention as SuffixSensitiveGISModelReader """
+        name = os.path.basename(model_path)
+        if name.endswith('.gz'):
+            stream = gzip.open(model_path, 'rb')
+            name = name[:-3]
+        else:
+            stream = open(model_path, 'rb')
+        if name.endswith('.bin'):
+            return _BinaryModelReader(stream)
+        return _PlainTextModelReader(stream)
+
+    @staticmethod
+    def parse_contexts(contexts):
+        """
+        split `name=value' contexts, see RealValueFileEventStream.parseContexts
+        :return: (contexts, values), values is None if no context carries a value
+        """
+        has_real_value = False
+        names = []
+        values = []
+        for c in contexts:
+            value = 1.0
+            ei = c.rfind('=')
+            if 0 < ei < len(c) - 1:
+                try:
+                    value = _float32.unpack(_float32.pack(float(c[ei+1:])))[0]
+                except ValueError:
+                    print >> logs, 'Unable to determine value in context:%s' % c
+                else:
+                    if value < 0:
+                        raise ValueError('Negitive values are not allowed: %s' % c)
+                    c = c[:ei]
+                    has_real_value = True
+            names.append(c)
+            values.append(value)
+        return names, values if has_real_value else None
+
+    def eval(self, contexts, values=None):
+        return self.eval_predicates([self.pred_index.get(c) for c in contexts], values)
+
+    def eval_predicates(self, pids, values=None):
+        """ eval on predicate ids, None for the contexts the model does not know """
+        num_outcomes = len(self.outcomes)
+        prior = [0.0] * num_outcomes
+        num_feats = [0] * num_outcomes
+        if self.bias is not None:
+            outcome_ids, params = self.params[self.bias]
+            for oid, param in zip(outcome_ids, params):
+                num_feats[oid] += 1
+                prior[oid] += param
+        for ci, pid in enumerate(pids):
+            if pid is None:
+                continue
+            value = values[ci] if values is not None else 1.0
+            outcome_ids, params = self.params[pid]
+            for oid, param in zip(outcome_ids, params):
+                num_feats[oid] += 1
+                prior[oid] += param * value
+
+        for oid in range(num_outcomes):
+            prior[oid] *= self.constant_inverse
+            if self.correction_param != 0:
+                prior[oid] += (1.0 - num_feats[oid] / float(self.correction_constant)) * self.correction_param
+        # shift by the max score, the normalized distribution is unchanged
+        top = max(prior)
+        ocs = [math.exp(p - top) for p in prior]
+        normal = sum(ocs)
+        return [p / normal for p in ocs]
+
+    def best_outcome(self, ocs):
+        best = 0
+        for i in range(1, len(ocs)):
+            if ocs[i] > ocs[best]:
+                best = i
+        return self.outcomes[best]
+
+    def all_outcomes(self, ocs):
+        return '  '.join('%s[%.4f]' % (o, p) for o, p in zip(self.outcomes, ocs))
+
+    def eval_line(self, line):
+        """
+        score one feature line, the trailing label is dropped as Predict.java does
+        """
+        line = line.rstrip('\r\n')
+        contexts = line[:line.rfind(' ')].split(' ')
+        # java's String.split discards trailing empty strings
+        while len(contexts) > 0 and contexts[-1] == '':
+            contexts.pop()
+        contexts, values = self.parse_contexts(contexts)
+        return self.eval(contexts, values)
+
+    def predict(self, lines):
+        return [self.best_outcome(self.eval_line(l)) for l in lines]
+
+    def predict_batch(self, batch):
+        """
+        predict on a SparseBatch, each column the rows use is looked up once
+        and every row is scored on predicate ids
+        """
+        names = batch.index.names
+        columns = dict((c, self.pred_index.get(names[c])) for c in set(batch.indices))
+        res = []
+        for r in range(len(batch)):
+            indices, data = batch.row(r)
+            res.append(self.best_outcome(self.eval_predicates([columns[c] for c in indices], data)))
+        return res
+
+    def predict_file(self, test_file, predict_file):
+        to_file = codecs.open(predict_file, 'w', 'utf-8')
+        for line in codecs.open(test_file, 'r', 'utf-8'):
+            ocs = self.eval_line(line)
+            to_file.write('%s  %s\n' % (self.all_outcomes(ocs), self.best_outcome(ocs)))
+        to_file.close()
+
+
+_loaded_models = {}
+
+
+def load_model(model_path):
+    """
+    models are loaded once per process, and reloaded only if the file changes
+    """
+    model_path = os.path.abspath(model_path)
+    mtime = os.path.getmtime(model_path)
+    if model_path not in _loaded_models or _loaded_models[model_path][0] != mtime:
+        print >> logs, 'load maxent model: %s' % model_path
+        _loaded_models[model_path] = (mtime, GISModel(model_path))
+    return _loaded_models[model_path][1]
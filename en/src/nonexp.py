@@ -12,6 +12,7 @@ from corpus import Corpus
 from common import *
 from relation import Relation
 from feature import Feature
+from sparse import FeatureFile
 
 logs = sys.stderr
 
@@ -35,37 +36,40 @@ class NonExplicit:
         # feat_vec += self.feat_handle.extract_polarity(relation)
         feat_vec += self.feat_handle.extract_word_pair(relation)
         feat_vec += self.feat_handle.extract_brown_cluster(relation)
-        to_line = ' '.join(feat_vec)
+        features = [(f, 1) for f in feat_vec]
         for label in labels:
-            to_file.write('%s %s\n' % (to_line, label))
+            to_file.add(features, label)
 
     def prepare_data(self, parse_path, rel_path, raw_home, which, to_file):
         rel_dict = Corpus.read_relations(rel_path)
         dist = defaultdict(int)
         for art in Corpus.read_parses(parse_path, rel_dict):
-            for rel in art.relations:
-                if rel.rel_type == 'Explicit':
-                    continue
-                rel.article = art
-                rel.get_arg_leaves()
-                labels = {s.replace(' ','_') for s in rel.sense}
-                labels = {s for s in labels if s in NONEXP_SENSES}
-                for l in labels:
-                    dist[l] += 1
-                if which == 'test':
-                    labels = ['|'.join(labels)]
-
-                self.print_features(rel, labels, to_file)
-
-            if which=='train':
-                art.read_raw_text(raw_home+'/'+art.id)
-                self.generate_nonexp_relations(art)
-                for rel in art.nonexp_relations:
-                    labels = ['NoRel']
-                    self.print_features(rel, labels, to_file)
+            self.prepare_article(art, raw_home, which, to_file, dist)
 
         print >> logs, dist
 
+    def prepare_article(self, art, raw_home, which, to_file, dist):
+        for rel in art.relations:
+            if rel.rel_type == 'Explicit':
+                continue
+            rel.article = art
+            rel.get_arg_leaves()
+            labels = {s.replace(' ','_') for s in rel.sense}
+            labels = {s for s in labels if s in NONEXP_SENSES}
+            for l in labels:
+                dist[l] += 1
+            if which == 'test':
+                labels = ['|'.join(labels)]
+
+            self.print_features(rel, labels, to_file)
+
+        if which=='train':
+            art.read_raw_text(raw_home+'/'+art.id)
+            self.generate_nonexp_relations(art)
+            for rel in art.nonexp_relations:
+                labels = ['NoRel']
+                self.print_features(rel, labels, to_file)
+
     def generate_nonexp_relations(self, article):
         for para in article.paragraphs:
             for s1, s2 in zip(para.sentences[:-1], para.sentences[1:]):
@@ -105,17 +109,17 @@ class NonExplicit:
         Corpus.test_with_opennlp(test_file, self.model_file, predicted_file)
 
     def test(self):
-        to_file = open(self.test_file, 'w')
+        to_file = FeatureFile(self.test_file)
         self.prepare_data(DEV_PARSE_PATH, DEV_REL_PATH, DEV_RAW_PATH, 'test', to_file)
         to_file.close()
         Corpus.test_with_opennlp(self.test_file, self.model_file, self.predicted_file)
 
     def train(self):
-        to_file = open(self.train_file, 'w')
+        to_file = FeatureFile(self.train_file)
         # self.prepare_data(DEV_PARSE_PATH, DEV_REL_PATH, DEV_RAW_PATH, 'train', to_file)
         self.prepare_data(TRAIN_PARSE_PATH, TRAIN_REL_PATH, TRAIN_RAW_PATH, 'train', to_file)
         to_file.close()
-        Corpus.train_with_opennlp(self.train_file, self.model_file)
+        Corpus.train_maxent(self.train_file, self.model_file)
 
     def print_performance(self):
         gold = [it.strip().split()[-1].split('|') for it in open(self.test_file)]
@@ -22,13 +22,7 @@ class Paragraph(object):
 
     # check adjacent sentences has explicit relation
     def has_exp_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        sid2 = self.sentences[idx+1].id
-
-        for rel in self.article.exp_relations:
-            if rel.arg1_sid == sid1 and rel.arg2_sid == sid2:
-                return True
-        return False
+        return (self.sentences[idx].id, self.sentences[idx+1].id) in self.article.exp_relation_index
 
     def __str__(self):
         return 'begin %s, end %s' % (self.begin_offset, self.end_offset)
@@ -8,6 +8,8 @@ several times slower than the original porter algorithm as implemented
 in stemming.porter.
 """
 
+import os
+import glob
 import re
 
 r_exp = re.compile(r"[^aeiouy]*[aeiouy]+[^aeiouy](\w*)")
@@ -282,3 +284,106 @@ def stem(word):
     return word
 
 
+class StemCache(object):
+    """
+    memo of stem() bounded to max_size words, optionally kept in a file of
+    "word stem" lines between runs; word frequencies are skewed, so once it
+    is full the words seen so far are kept and the rest are stemmed each time
+
+    forked workers inherit the cache and save the words they add to a shard
+    of their own next to the file, the shards are merged into it on loading
+    """
+    __slots__ = ('table', 'max_size', 'path', 'owner', 'hits', 'misses', 'added')
+
+    def __init__(self, max_size=100000, path=None):
+        self.table = {}
+        self.max_size = max_size
+        self.path = path
+        self.owner = os.getpid()
+        self.hits = 0
+        self.misses = 0
+        # words stemmed by this process, and by its parent before the fork
+        self.added = []
+        if path is None:
+            return
+        shards = [p for p in glob.glob(self._shard_path('*')) if not p.endswith('.tmp')]
+        for p in [path] + shards:
+            self._load(p)
+        if len(shards) > 0:
+            self._write(path, self.table.iteritems())
+            for p in shards:
+                try:
+                    os.remove(p)
+                except OSError:
+                    # merged by another process at the same time
+                    pass
+
+    def _shard_path(self, pid):
+        return '%s.worker%s' % (self.path, pid)
+
+    def _load(self, path):
+        if not os.path.exists(path):
+            return
+        with open(path, 'rb') as f:
+            for line in f:
+                if len(self.table) >= self.max_size:
+                    break
+                fields = line.rstrip('\n').split(' ', 1)
+                if len(fields) != 2:
+                    continue
+                try:
+                    word, word_stem = [self._unescape(x) for x in fields]
+                except UnicodeDecodeError:
+                    continue
+                self.table[word] = word_stem
+
+    @staticmethod
+    def _write(path, entries):
+        """ through a temporary file renamed over path, readers never see half of it """
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            for word, word_stem in entries:
+                f.write('%s %s\n' % (StemCache._escape(word), StemCache._escape(word_stem)))
+        os.rename(tmp_path, path)
+
+    @staticmethod
+    def _escape(word):
+        """ ascii with no spaces or line breaks of any kind, unicode ones included """
+        return word.encode('unicode_escape').replace(' ', '\\x20')
+
+    @staticmethod
+    def _unescape(field):
+        return field.decode('unicode_escape')
+
+    def stem(self, word):
+        res = self.table.get(word)
+        if res is not None:
+            self.hits += 1
+            return res
+        self.misses += 1
+        res = stem(word)
+        if len(self.table) < self.max_size:
+            self.table[word] = res
+            self.added.append(word)
+        return res
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups > 0 else 0.0
+
+    def __str__(self):
+        return 'stem cache: %d lookups, %.2f%% hits, %d of %d entries' % \
+            (self.hits + self.misses, 100 * self.hit_rate(), len(self.table), self.max_size)
+
+    def save(self):
+        """
+        write the table back to path if it grew, a forked worker writes the
+        words it added to its shard instead
+        """
+        if self.path is None or len(self.added) == 0:
+            return
+        if os.getpid() == self.owner:
+            self._write(self.path, self.table.iteritems())
+            self.added = []
+        else:
+            self._write(self._shard_path(os.getpid()), ((w, self.table[w]) for w in self.added))
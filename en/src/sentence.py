@@ -1,9 +1,18 @@
 __author__ = 'Sheng Li'
-from porter2 import stem
-from tree import Tree
+from bisect import bisect_left
+from porter2 import StemCache
+from tree import Tree, CompactTree
 from deptree import DepTree
+from conn_matcher import ConnMatcher
 
-from common import Conn_intra, Conn_group, punc1, punc2, punc3
+from common import Conn_intra, Conn_group, punc1, punc2, punc3, COMPACT_TREES, STEM_CACHE_SIZE, STEM_CACHE_PATH
+
+# shared by all the sentences of a process
+stem_cache = StemCache(STEM_CACHE_SIZE, STEM_CACHE_PATH)
+
+# the group connectives followed by the parts of the intra-sentential ones
+_conn_parts = sorted(set(p for a in Conn_intra for p in a.split('..')) - set(Conn_group))
+_conn_matcher = ConnMatcher(Conn_group + _conn_parts)
 
 class Sentence(object):
     __slots__ = ('leaves', 'id', 'tree', 'true_connectives', 'checked_connectives', 'depTree', 'words', 'word_ids',
@@ -12,7 +21,7 @@ class Sentence(object):
     def __init__(self, sent_id, parse_tree, dep_tree, words):
         self.leaves = []
         self.id = sent_id
-        self.tree = Tree(parse_tree, sent_id)
+        self.tree = (CompactTree if COMPACT_TREES else Tree)(parse_tree, sent_id)
         self.get_leaves()
         self.words = words
         self.begin_offset = words[0][1]['CharacterOffsetBegin']
@@ -31,51 +40,38 @@ class Sentence(object):
 
     def stem_leaf(self):
         for leaf in self.leaves:
-            leaf.stem = stem(leaf.value)
+            leaf.stem = stem_cache.stem(leaf.value)
 
     def check_connectives(self):
-        length = len(self.leaves)
+        matches = _conn_matcher.find([leaf.lowercased for leaf in self.leaves])
+        starts = _conn_matcher.positions(matches)
         for a in Conn_intra:
             conns = a.split('..')
-            checked = [None, None]
-            i1 = i2 = length
-            for i in range(length):
-                if self.leaves[i].lowercased == conns[0]:
-                    checked[0] = self.leaves[i]
-                    i1 = i+1
-                    break
-            for i in range(i1, length):
-                if self.leaves[i].lowercased == conns[1]:
-                    checked[1] = self.leaves[i]
-                    i2 = i
-                    break
-            if checked[0] is not None and checked[1] is not None:
+            if len(starts[conns[0]]) == 0:
+                continue
+            i1 = starts[conns[0]][0] + 1
+            k = bisect_left(starts[conns[1]], i1)
+            if k == len(starts[conns[1]]):
+                continue
+            i2 = starts[conns[1]][k]
+            checked = [self.leaves[i1-1], self.leaves[i2]]
+            for ch in checked:
+                ch.is_conn = True
+            self.checked_connectives.append(checked)
+            if a == 'if..then':
+                for i in starts['if'][bisect_left(starts['if'], i1):bisect_left(starts['if'], i2)]:
+                    self.leaves[i].is_conn = True
+                    self.checked_connectives.append([self.leaves[i], checked[1]])
+
+        # a group connective is only taken if none of its words is taken yet
+        for rank, i in matches:
+            if rank >= len(Conn_group):
+                break
+            checked = self.leaves[i:i+len(Conn_group[rank].split())]
+            if not any(ch.is_conn for ch in checked):
                 for ch in checked:
                     ch.is_conn = True
                 self.checked_connectives.append(checked)
-                if a == 'if..then':
-                    for i in range(i1, i2):
-                        if self.leaves[i].lowercased == 'if':
-                            self.leaves[i].is_conn = True
-                            self.checked_connectives.append([self.leaves[i], checked[1]])
-
-        for a in Conn_group:
-            conns = a.split()
-            len_conns = len(conns)
-            for i in range(length-len_conns+1):
-                ok = True
-                checked = []
-                for j in range(len_conns):
-                    if conns[j] != self.leaves[i+j].lowercased or self.leaves[i+j].is_conn:
-                        ok = False
-                        break
-                    else:
-                        checked.append(self.leaves[i+j])
-
-                if ok:
-                    for ch in checked:
-                        ch.is_conn = True
-                    self.checked_connectives.append(checked)
         return self.checked_connectives
 
     def get_syntactic_features(self, self_node, parent_node, left_sib_node, right_sib_node):
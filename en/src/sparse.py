@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Feature batches kept as compressed sparse row matrices, each batch numbers
+the feature names it meets in its own FeatureIndex unless it is given one.
+The print_features of the components add (feature, value) rows to a
+SparseBatch, or to a FeatureFile for the train and test files
+"""
+import codecs
+import struct
+from array import array
+
+from maxent import GISModel
+
+_MAGIC = 'CSR1'
+_header = struct.Struct('<4sII')  # magic, number of rows, number of stored values
+
+
+def _encode(s):
+    return s.encode('utf-8') if isinstance(s, unicode) else s
+
+
+def context(name, value):
+    """ a (feature, value) pair as a context of a feature line, see GISModel.parse_contexts """
+    return name if value == 1 else '%s=%s' % (name, value)
+
+
+class FeatureFile(object):
+    """ feature lines of (feature, value) rows, read by the trainers and eval/Predict.java """
+    __slots__ = ('file',)
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+
+    def add(self, features, label):
+        self.file.write('%s %s\n' % (' '.join(context(name, value) for name, value in features), label))
+
+    def close(self):
+        self.file.close()
+
+
+class FeatureIndex(object):
+    """ feature name <-> column id, ids are given in order of first use """
+    __slots__ = ('ids', 'names')
+
+    def __init__(self, names=()):
+        self.ids = {}
+        self.names = []
+        for name in names:
+            self.add(name)
+
+    def add(self, name):
+        fid = self.ids.get(name)
+        if fid is None:
+            fid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return fid
+
+    def get(self, name, default=-1):
+        return self.ids.get(name, default)
+
+    def __len__(self):
+        return len(self.names)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            for name in self.names:
+                f.write(_encode(name) + '\n')
+
+    @staticmethod
+    def load(path):
+        return FeatureIndex(l.rstrip('\n') for l in codecs.open(path, 'r', 'utf-8'))
+
+
+class SparseBatch(object):
+    """
+    in-memory stand-in for the FeatureFile handed to print_features, each
+    added row keeps the ids and values of its features and its label, the
+    lines of a feature file are split as eval/Predict.java splits them
+
+    row r holds indices[indptr[r]:indptr[r+1]] with the values at the same
+    positions of data, repeated contexts are kept as they count twice in GIS
+    """
+    __slots__ = ('index', 'indptr', 'indices', 'data', 'labels')
+
+    def __init__(self, index=None):
+        self.index = FeatureIndex() if index is None else index
+        self.indptr = array('i', [0])
+        self.indices = array('i')
+        self.data = array('f')
+        self.labels = []
+
+    def write(self, line):
+        line = line.rstrip('\r\n')
+        split = line.rfind(' ')
+        contexts = line[:split].split(' ')
+        # java's String.split discards trailing empty strings
+        while len(contexts) > 0 and contexts[-1] == '':
+            contexts.pop()
+        names, values = GISModel.parse_contexts(contexts)
+        add = self.index.add
+        self.indices.extend(add(name) for name in names)
+        if values is None:
+            self.data.extend([1.0] * len(names))
+        else:
+            self.data.extend(values)
+        self.indptr.append(len(self.indices))
+        self.labels.append(line[split+1:])
+
+    def add(self, features, label):
+        """ :param features: [(feature, value), ...], binary features weigh 1 """
+        add = self.index.add
+        for name, value in features:
+            if '=' in name:
+                # the row a reader of the FeatureFile line gets, the name may hold a value
+                names, values = GISModel.parse_contexts([context(name, value)])
+                name, value = names[0], 1.0 if values is None else values[0]
+            self.indices.append(add(name))
+            self.data.append(value)
+        self.indptr.append(len(self.indices))
+        self.labels.append(label)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def row(self, r):
+        begin, end = self.indptr[r], self.indptr[r+1]
+        return self.indices[begin:end], self.data[begin:end]
+
+    def lines(self):
+        """ feature lines equivalent to the rows, for the dump files """
+        names = self.index.names
+        res = []
+        for r in range(len(self)):
+            indices, data = self.row(r)
+            # a name holding '=' carries its value, or java would split it again
+            contexts = [names[c] if v == 1.0 and '=' not in names[c] else '%s=%.9g' % (names[c], v)
+                        for c, v in zip(indices, data)]
+            res.append('%s %s\n' % (' '.join(contexts), self.labels[r]))
+        return res
+
+    def dump(self, file_name):
+        to_file = codecs.open(file_name, 'w', 'utf-8')
+        for line in self.lines():
+            to_file.write(line)
+        to_file.close()
+
+    def save(self, path):
+        """ binary rows and labels, the column names are saved with the FeatureIndex """
+        with open(path, 'wb') as f:
+            f.write(_header.pack(_MAGIC, len(self), len(self.indices)))
+            self.indptr.tofile(f)
+            self.indices.tofile(f)
+            self.data.tofile(f)
+            f.write('\n'.join(_encode(l) for l in self.labels))
+
+    @staticmethod
+    def load(path, index):
+        """ :param index: the FeatureIndex saved along with the batch """
+        batch = SparseBatch(index)
+        with open(path, 'rb') as f:
+            magic, num_rows, nnz = _header.unpack(f.read(_header.size))
+            if magic != _MAGIC:
+                raise ValueError('not a saved sparse batch')
+            batch.indptr = array('i')
+            batch.indptr.fromfile(f, num_rows + 1)
+            batch.indices.fromfile(f, nnz)
+            batch.data.fromfile(f, nnz)
+            labels = f.read()
+        batch.labels = labels.split('\n') if num_rows > 0 else []
+        return batch
@@ -0,0 +1,154 @@
+#! /usr/bin/python
+# -*- coding: utf-8 -*-
+import os
+import sys
+import argparse
+import json
+
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+
+from corpus import Corpus, ParseCache
+from common import *
+from connective import Connective
+from argument import Argument
+from explicit import Explicit
+from nonexp import NonExplicit
+from attribution import Attribution
+from sparse import FeatureFile
+
+logs = sys.stderr
+
+
+class Trainer:
+    """
+    Generate the training files of all the components in a single pass over the corpus,
+    each Article is built once and handed to every component in turn
+    """
+    def __init__(self):
+        self.connective = Connective()
+        self.argument = Argument()
+        self.explicit = Explicit()
+        self.nonexp = NonExplicit()
+        self.attribution = Attribution()
+
+    def prepare_data(self, parse_path, rel_path, raw_home, which='train'):
+        files = {
+            'conn': FeatureFile(self.connective.train_file),
+            'arg': FeatureFile(self.argument.train_file),
+            'exp': FeatureFile(self.explicit.train_file),
+            'nonexp': FeatureFile(self.nonexp.train_file),
+            'attr': FeatureFile(self.attribution.train_file),
+        }
+        dist = defaultdict(int)
+        count = 0
+        rel_dict = Corpus.read_relations(rel_path)
+        for art in Corpus.read_parses(parse_path, rel_dict):
+            # the non-explicit component must see the relations before the argument
+            # extractor resolves the arguments of the explicit ones, otherwise
+            # Article.has_annotated_relation would count them and drop NoRel instances
+            self.connective.prepare_article(art, which, files['conn'])
+            self.explicit.prepare_article(art, which, files['exp'])
+            self.nonexp.prepare_article(art, raw_home, which, files['nonexp'], dist)
+            count += len(self.argument.prepare_article(art, which, files['arg']))
+            self.attribution.prepare_article(art, which, files['attr'])
+
+        for f in files.values():
+            f.close()
+        print >> logs, "processed %d argument instances" % count
+        print >> logs, dist
+
+    def components(self):
+        """
+        the feature file -> model file graph, no model depends on another one
+        :return: [(name, handler), ...]
+        """
+        return [('conn', self.connective), ('arg', self.argument), ('exp', self.explicit),
+                ('nonexp', self.nonexp), ('attr', self.attribution)]
+
+    @staticmethod
+    def stamp(train_file, options):
+        return {'train': ParseCache.file_digest(train_file), 'options': options}
+
+    @staticmethod
+    def is_stale(train_file, model_file, options):
+        stamp_file = model_file + '.stamp'
+        if not os.path.exists(model_file) or not os.path.exists(stamp_file):
+            return True
+        with open(stamp_file) as f:
+            return json.load(f) != Trainer.stamp(train_file, options)
+
+    def train_models(self, workers=None, force=False, options='-real'):
+        """
+        train the models whose train file or options changed since the last build,
+        at most `workers' at a time, or one after another on `workers' cores with L-BFGS
+        """
+        if MAXENT_TRAINER == 'lbfgs':
+            options = 'lbfgs l1=%r l2=%r' % (LBFGS_L1, LBFGS_L2)
+        tasks = []
+        for name, handler in self.components():
+            if force or self.is_stale(handler.train_file, handler.model_file, options):
+                tasks.append((name, handler.train_file, handler.model_file, options))
+            else:
+                print >> logs, '%s model is up to date: %s' % (name, handler.model_file)
+        if len(tasks) == 0:
+            return True
+
+        if workers is None:
+            workers = cpu_count()
+        if MAXENT_TRAINER == 'lbfgs':
+            # each model already trains on all the workers
+            results = [_train_model(task + (workers,)) for task in tasks]
+        else:
+            pool = Pool(min(workers, len(tasks)))
+            try:
+                results = pool.map(_train_model, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        succeeded = True
+        for (name, train_file, model_file, options), status in zip(tasks, results):
+            if status != 0:
+                print >> logs, 'failed to train %s model, exit status %d' % (name, status)
+                succeeded = False
+                continue
+            with open(model_file + '.stamp', 'w') as f:
+                json.dump(self.stamp(train_file, options), f)
+        return succeeded
+
+    def train(self):
+        self.prepare_data(TRAIN_PARSE_PATH, TRAIN_REL_PATH, TRAIN_RAW_PATH, 'train')
+        self.train_models()
+
+
+def _train_model(task):
+    name, train_file, model_file, options = task[:4]
+    print >> logs, 'train %s model: %s' % (name, model_file)
+    # the old stamp must not vouch for a half-written model
+    if os.path.exists(model_file + '.stamp'):
+        os.remove(model_file + '.stamp')
+    return Corpus.train_maxent(train_file, model_file, options, *task[4:])
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser("Single pass training data generator")
+    arg_parser.add_argument('-p', '--parse_path', help='parses.json of the training set', default=TRAIN_PARSE_PATH)
+    arg_parser.add_argument('-r', '--rel_path', help='relations.json of the training set', default=TRAIN_REL_PATH)
+    arg_parser.add_argument('-w', '--raw_home', help='raw text directory of the training set', default=TRAIN_RAW_PATH)
+    arg_parser.add_argument('-m', '--models', help='also train the models from the generated files',
+                            action='store_true')
+    arg_parser.add_argument('-s', '--skip_data', help='train from the existing training files',
+                            action='store_true')
+    arg_parser.add_argument('-j', '--jobs', help='number of models trained at the same time (cores per model with L-BFGS)',
+                            type=int)
+    arg_parser.add_argument('-f', '--force', help='retrain the models even if they are up to date',
+                            action='store_true')
+    args = arg_parser.parse_args()
+    print >> logs, 'Configs of Trainer:', json.dumps(vars(args), indent=2)
+    handler = Trainer()
+    if not args.skip_data:
+        handler.prepare_data(args.parse_path, args.rel_path, args.raw_home)
+    if args.models or args.skip_data:
+        if not handler.train_models(args.jobs, args.force):
+            sys.exit(1)
@@ -38,11 +38,11 @@ class Argument(object):
         while target is not None and prune_level < prune_level_limit:
             if target.parent_node is not None:
                 siblings = target.parent_node.child_nodes
-                candidate |= {(n, n.linker) for n in siblings if n != target}
+                candidate |= {(n, relation.linker(n)) for n in siblings if n != target}
             # target node doesn't cover conn leaves exactly
-            exact_cover = len(target.get_leaves()) == len(conn_leaves)
+            exact_cover = target.num_leaves() == len(conn_leaves)
             if not exact_cover:
-                candidate |= {(n, n.linker) for n in target.child_nodes if n != conn_node}
+                candidate |= {(n, relation.linker(n)) for n in target.child_nodes if n != conn_node}
             if which == 'test' and (target.value == 'IP' or target.value == 'S'):
                 target = None
             else:
@@ -56,8 +56,9 @@ class Argument(object):
                 prev_tree = relation.article.sentences[sid-1].tree
                 if not prev_tree.is_null():
                     prev_root = prev_tree.root
-                    if prev_root.linker == 'arg1' or prev_root.linker == 'arg2':
-                        candidate.add( (prev_root, prev_root.linker) )
+                    linker = relation.linker(prev_root)
+                    if linker == 'arg1' or linker == 'arg2':
+                        candidate.add( (prev_root, linker) )
                     else:
                         candidate.add( (prev_root, 'None') )
 
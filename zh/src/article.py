@@ -5,6 +5,7 @@ import sys
 from sentence import Sentence
 from relation import Relation
 from common import DEV_RAW_PATH
+from bisect import bisect_right
 from collections import defaultdict
 
 logs = sys.stderr
@@ -14,7 +15,8 @@ class Article(object):
     __slots__ = ('id', 'params', 'sentences', 'paragraphs', 'disc_connectives',
                  'entity_relations', 'relations', 'exp_disc_conns', 'implicit_relations', 'real_inter_relations',
                  'real_intra_relations', 'auto_inter_relations', 'auto_intra_relations', 'exp_relations',
-                 'nonexp_relations', 'auto_exp_relations', 'auto_nonexp_relations', 'auto_all_relations', 'raw_text_path')
+                 'nonexp_relations', 'auto_exp_relations', 'auto_nonexp_relations', 'auto_all_relations', 'raw_text_path',
+                 'relation_index', 'exp_relation_index')
 
     def __init__(self, name, params):
         self.id = name
@@ -35,8 +37,14 @@ class Article(object):
         # auto all relations
         self.auto_all_relations = []
 
+        # (arg1_sid, arg2_sid) -> relations, see index_relation and index_exp_relation
+        self.relation_index = defaultdict(list)
+        self.exp_relation_index = defaultdict(list)
+
     def read_raw_text(self, raw_text_path):
-        characters = ''.join(open(raw_text_path).readlines())
+        with open(raw_text_path) as f:
+            characters = f.read()
+        self.paragraphs = []
         begin = 0  # each article begins with ".START"
         pid = 0
         while 1:
@@ -47,14 +55,14 @@ class Article(object):
             pid += 1
             begin = pc + 2  # '\n\n'
 
+        # paragraphs are disjoint and in offset order, so only the last one
+        # beginning at or before a sentence can contain it
+        begins = [para.begin_offset for para in self.paragraphs]
         for sen in self.sentences:
-            flag = False
-            for para in self.paragraphs:
-                if sen.begin_offset >= para.begin_offset and sen.end_offset <= para.end_offset:
-                    para.sentences.append(sen)
-                    flag = True
-                    break
-            if not flag:
+            i = bisect_right(begins, sen.begin_offset) - 1
+            if i >= 0 and sen.end_offset <= self.paragraphs[i].end_offset:
+                self.paragraphs[i].sentences.append(sen)
+            else:
                 print >> logs, 'sentence outof paragraph'
 
     def set_article_level_word_id(self):
@@ -72,30 +80,25 @@ class Article(object):
                 for leaf, wid in zip(sen.leaves, sen.word_ids):
                     leaf.leaf_id = wid
 
-    def has_exp_inter_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        sid2 = self.sentences[idx+1].id
+    def index_relation(self, rel):
+        """ called as the arguments of an annotated relation are resolved """
+        for sid1 in rel.arg1_sid:
+            for sid2 in rel.arg2_sid:
+                if rel not in self.relation_index[(sid1, sid2)]:
+                    self.relation_index[(sid1, sid2)].append(rel)
 
-        for rel in self.exp_relations:
-            if rel.arg1_sid == sid1 and rel.arg2_sid == sid2:
-                return True
-        return False
+    def index_exp_relation(self, rel):
+        """ called once arg1_sid and arg2_sid of an explicit relation are set """
+        self.exp_relation_index[(rel.arg1_sid, rel.arg2_sid)].append(rel)
+
+    def has_exp_inter_relation(self, idx):
+        return (self.sentences[idx].id, self.sentences[idx+1].id) in self.exp_relation_index
 
     def has_exp_intra_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        for rel in self.exp_relations:
-            if rel.arg1_sid == sid1 and rel.arg2_sid == sid1:
-                return True
-        return False
+        return (self.sentences[idx].id, self.sentences[idx].id) in self.exp_relation_index
 
     def has_inter_relation(self, idx):
-        sid1 = self.sentences[idx].id
-        sid2 = self.sentences[idx+1].id
-
-        for rel in self.relations:
-            if sid1 in rel.arg1_sid and sid2 in rel.arg2_sid:
-                return True
-        return False
+        return (self.sentences[idx].id, self.sentences[idx+1].id) in self.relation_index
 
     # only for auto parsed explicit relations
     def remove_confilict_relations(self):
@@ -115,6 +118,10 @@ class Article(object):
         if len(removed) > 0:
             print >> sys.stderr, 'article has confilict connectives'
             self.exp_relations = [rel for idx, rel in enumerate(self.exp_relations) if idx not in removed]
+            for key in self.exp_relation_index.keys():
+                self.exp_relation_index[key] = [rel for rel in self.exp_relation_index[key] if rel in self.exp_relations]
+                if len(self.exp_relation_index[key]) == 0:
+                    del self.exp_relation_index[key]
 
 
 if __name__ == '__main__':
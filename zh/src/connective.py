@@ -88,7 +88,8 @@ class Connective():
         for sentence in article.sentences:
             all_conns = sentence.check_connectives()
             checked_conns += all_conns
-            for conn in all_conns:
+            windows = Corpus.context_window(all_conns, article)
+            for conn, (prev_word, prev_pos, next_word, next_pos) in zip(all_conns, windows):
                 conn_str = '_'.join(n.value for n in conn)
                 to_file_line = ''
                 to_file_line += 'conn:'+conn_str+' '
@@ -96,20 +97,16 @@ class Connective():
                 conn_pos = '_'.join([x.parent_node.value for x in conn])
                 to_file_line += 'lexsyn:conn_POS:'+conn_pos+' '
 
-                prev_leaf = Corpus.get_other_leaf(conn[0], -1, article)
-                if prev_leaf is not None:
-                    to_file_line += 'lexsyn:with_prev_full:'+prev_leaf.value+'_'+conn_str+' '
+                if prev_word is not None:
+                    to_file_line += 'lexsyn:with_prev_full:'+prev_word+'_'+conn_str+' '
 
-                    prev_pos = prev_leaf.parent_node.value
                     to_file_line += 'lexsyn:prev_POS:'+prev_pos+' '
                     to_file_line += 'lexsyn:with_prev_POS:'+prev_pos+'_'+conn_pos.split('_')[0]+' '
                     to_file_line += 'lexsyn:with_prev_POS_full:'+prev_pos+'_'+conn_pos+' '
 
-                next_leaf = Corpus.get_other_leaf(conn[-1], 1, article)
-                if next_leaf is not None:
-                    to_file_line += 'lexsyn:with_next_full:'+conn_str+'_'+next_leaf.value+' '
+                if next_word is not None:
+                    to_file_line += 'lexsyn:with_next_full:'+conn_str+'_'+next_word+' '
 
-                    next_pos = next_leaf.parent_node.value
                     to_file_line += 'lexsyn:next_POS:'+next_pos+' '
                     to_file_line += 'lexsyn:with_next_POS:'+conn_pos.split('_')[-1]+'_'+next_pos+' '
                     to_file_line += 'lexsyn:with_next_POS_full:'+conn_pos+'_'+next_pos+' '
@@ -29,14 +29,38 @@ class Corpus(object):
 
     @staticmethod
     def get_other_leaf(curr, offset, article):
-        tree = curr.goto_tree()
-        sen = article.sentences[tree.sent_id]
-        leaves = sen.leaves
-        curr_index = sen.leaves.index(curr)
-        if curr_index != -1:
-            expect_index = offset + curr_index
-            if expect_index >= 0 and expect_index < len(leaves):
-                return leaves[expect_index]
+        # a leaf spans [i, i+1) where i is its position in the leaves of its sentence
+        leaves = article.sentences[curr.goto_tree().sent_id].leaves
+        expect_index = offset + curr.span[0]
+        if expect_index >= 0 and expect_index < len(leaves):
+            return leaves[expect_index]
+
+    @staticmethod
+    def context_window(conns, article):
+        """
+        :param conns: candidate connectives, lists of leaves
+        :return: [(prev word, prev POS, next word, next POS), ...] for the leaves
+        around each connective, None past the edges of its sentence
+        """
+        # words and POS tags of each sentence are listed once for the whole batch
+        columns = {}
+
+        def column(leaf):
+            sid = leaf.goto_tree().sent_id
+            if sid not in columns:
+                leaves = article.sentences[sid].leaves
+                columns[sid] = ([n.value for n in leaves], [n.parent_node.value for n in leaves])
+            return columns[sid]
+
+        res = []
+        for conn in conns:
+            words, tags = column(conn[0])
+            i = conn[0].span[0] - 1
+            prev = (words[i], tags[i]) if 0 <= i < len(words) else (None, None)
+            words, tags = column(conn[-1])
+            i = conn[-1].span[0] + 1
+            res.append(prev + ((words[i], tags[i]) if 0 <= i < len(words) else (None, None)))
+        return res
 
     @staticmethod
     def load_brown_cluster(brown_cluster_path):
@@ -137,6 +137,7 @@ class DiscourseParser(object):
                 rel.arg2_addr = [n.leaf_id for n in rel.arg2_leaves]
                 rel.arg2_sid = rel.arg2_leaves[0].goto_tree().sent_id if len(rel.arg2_leaves) > 0 else -1
                 rel.arg2_text = ' '.join(n.value for n in rel.arg2_leaves)
+                rel.article.index_exp_relation(rel)
 
         assert len(arg_prev_res) == index, 'arg prev size not match'
         assert len(arg_res) == s, 'arg candidate size not match'
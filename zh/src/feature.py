@@ -19,7 +19,8 @@ brown_rule_path = FILE_PATH + '/../lib/mi-brown-c100.txt'
 
 class Feature(object):
 
-    __slots__ = 'word_dict', 'rule_dict', 'dep_dict', 'levin_dict', 'mpqa_dict', 'neg_inq_dict', 'brown_cluster', 'brown_dict'
+    __slots__ = 'word_dict', 'rule_dict', 'dep_dict', 'levin_dict', 'mpqa_dict', 'neg_inq_dict', 'brown_cluster', 'brown_dict', \
+                'word_pair_index', 'rule_rank', 'dep_rank'
 
     """
     provide various methods to extact features
@@ -72,6 +73,13 @@ class Feature(object):
                 self.word_dict[items[0]] = float(items[-1])
                 count += 1
 
+        # stem1 -> [(stem2, pair)] of the pairs, stems may contain '_' so every split is listed
+        self.word_pair_index = defaultdict(list)
+        for pair in self.word_dict:
+            for i, c in enumerate(pair):
+                if c == '_':
+                    self.word_pair_index[pair[:i]].append((pair[i+1:], pair))
+
     def _load_production_rule(self, num=500):
         self.rule_dict = defaultdict(float)
         count = 0
@@ -83,6 +91,9 @@ class Feature(object):
                 self.rule_dict[items[0]] = float(items[-1])
                 count += 1
 
+        # rule -> position in rule_dict iteration order
+        self.rule_rank = dict((k, i) for i, k in enumerate(self.rule_dict))
+
     def _load_dependency_rule(self, num=500):
         self.dep_dict = defaultdict(float)
         count = 0
@@ -94,6 +105,9 @@ class Feature(object):
                 self.dep_dict[items[0]] = float(items[-1])
                 count += 1
 
+        # rule -> position in dep_dict iteration order
+        self.dep_rank = dict((k, i) for i, k in enumerate(self.dep_dict))
+
     @staticmethod
     def extract_first_last(rel):
         """
@@ -295,14 +309,22 @@ class Feature(object):
             else:
                 n.get_production_rules(res2, -1)
 
+        return self._rule_features(self.rule_rank, res1, res2)
+
+    @staticmethod
+    def _rule_features(rank, res1, res2):
+        """
+        the rules of the two arguments found in a rule lexicon, in the order
+        of the lexicon as if all of it was scanned
+        """
         feat_vec = []
-        for k in self.rule_dict:
+        found = set(k for k in res1.keys() + res2.keys() if k in rank)
+        for k in sorted(found, key=rank.__getitem__):
             a1 = k in res1
             a2 = k in res2
             if a1: feat_vec.append(k + ":1")
             if a2: feat_vec.append(k + ":2")
             if a1 and a2: feat_vec.append(k + ":12")
-
         return feat_vec
 
     def extract_dependency_rules(self, relation):
@@ -316,15 +338,7 @@ class Feature(object):
         DepTree.get_dependency_rules(res1, relation.arg1_leaves, False, True)
         DepTree.get_dependency_rules(res2, relation.arg2_leaves, False, True)
 
-        feat_vec = []
-        for k in self.dep_dict:
-            a1 = k in res1
-            a2 = k in res2
-            if a1: feat_vec.append(k + ":1")
-            if a2: feat_vec.append(k + ":2")
-            if a1 and a2: feat_vec.append(k + ":12")
-
-        return feat_vec
+        return self._rule_features(self.dep_rank, res1, res2)
 
     def extract_arg2_first3(self, relation):
         """
@@ -337,23 +351,26 @@ class Feature(object):
         return feat_vec
 
     def extract_word_pair(self, rel):
+        # the pairs are only looked up for distinct stems, and added to the set
+        # in the order the loop over all leaf pairs would first meet them
+        arg2_rank = dict((s2, i) for i, s2 in enumerate(_distinct(w.stem for w in rel.arg2_leaves)))
         tmp = set()
-        for w1 in rel.arg1_leaves:
-            for w2 in rel.arg2_leaves:
-                k = w1.stem + "_" + w2.stem
-                if k in self.word_dict:
-                    tmp.add(k)
+        for s1 in _distinct(w.stem for w in rel.arg1_leaves):
+            found = [(arg2_rank[s2], s2) for s2, _ in self.word_pair_index.get(s1, []) if s2 in arg2_rank]
+            for _, s2 in sorted(found):
+                tmp.add(s1 + "_" + s2)
 
         return ["%s:1" % k for k in tmp]
 
     def extract_brown_cluster(self, rel):
+        # each distinct word is looked up once
+        clusters1 = _distinct(self.brown_cluster.get(w, 'nil') for w in _distinct(w.value for w in rel.arg1_leaves))
+        clusters2 = _distinct(self.brown_cluster.get(w, 'nil') for w in _distinct(w.value for w in rel.arg2_leaves))
         tmp = set()
-        for w1 in rel.arg1_leaves:
-            for w2 in rel.arg2_leaves:
-                k = 'b:'+self.brown_cluster.get(w1.value, 'nil') + '_b:' \
-                        + self.brown_cluster.get(w2.value, 'nil')
+        for c1 in clusters1:
+            for c2 in clusters2:
                 # if k in self.brown_dict:
-                tmp.add(k)
+                tmp.add('b:' + c1 + '_b:' + c2)
 
         return ["%s:1" % k for k in tmp]
 
@@ -386,3 +403,14 @@ class Feature(object):
         if rel[1] == 'Explicit':
             res.append('arg2_conn:%s' % '_'.join(n.value.lower() for n in rel.conn_leaves))
         return res
+
+
+def _distinct(values):
+    """ the distinct values in the order of their first occurrence """
+    seen = set()
+    res = []
+    for v in values:
+        if v not in seen:
+            seen.add(v)
+            res.append(v)
+    return res
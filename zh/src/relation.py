@@ -29,6 +29,7 @@ class Relation(object):
         self.arg2_leaves = []
         self.arg1s = {}
         self.arg2s = {}
+        self.linkers = {}
 
     def init_with_annotation(self, json_str):
         self.doc_id = json_str['DocID']
@@ -53,6 +54,7 @@ class Relation(object):
         self.arg2_leaves = []
         self.arg1s = {}
         self.arg2s = {}
+        self.linkers = {}
 
     def __str__(self):
         return "doc:%s rel:%s" % (self.doc_id, self.rel_id)
@@ -65,6 +67,7 @@ class Relation(object):
 
         self.arg2_sid, self.arg2_leaves, self.arg2s['parsed'] = \
                 self._resolve_leaves(self.arg2_addr)
+        self.article.index_relation(self)
 
     def _resolve_leaves(self, addrs):
         args = defaultdict(list)
@@ -118,11 +121,26 @@ class Relation(object):
         DepTree.get_dependency_rules(rule_dict, self.arg2_leaves, with_leaf, with_label)
 
     def set_linker(self):
-        for n in self.arg1s['parsed']:
-            n.recursive_set_linker('arg1')
-
-        for n in self.arg2s['parsed']:
-            n.recursive_set_linker('arg2')
+        """
+        record the pre-order intervals of the parsed arguments, the trees are left untouched
+        """
+        self.linkers = defaultdict(list)
+        for label, nodes in [('arg1', self.arg1s['parsed']), ('arg2', self.arg2s['parsed'])]:
+            for n in nodes:
+                index = n.tree.get_index()
+                i = index.order[n]
+                self.linkers[n.tree].append((i, index.last[i], label))
+
+    def linker(self, node):
+        """ the argument a node belongs to, arg2 wins where the two overlap """
+        res = 'None'
+        intervals = self.linkers.get(node.tree, [])
+        if len(intervals) > 0:
+            i = node.tree.get_index().order[node]
+            for begin, end, label in intervals:
+                if begin <= i <= end:
+                    res = label
+        return res
 
     def output_json_format(self):
         """
@@ -1,11 +1,17 @@
 __author__ = 'Sheng Li'
 import sys
+from bisect import bisect_left
 from tree import Tree
 from deptree import DepTree
+from conn_matcher import ConnMatcher
 import copy
 
 from common import CONN_INTRA, CONN_GROUP, CLAUSE_PUNCS
 
+# the group connectives followed by the parts of the intra-sentential ones
+_conn_parts = sorted(set(p for a in CONN_INTRA for p in a.split('..')) - set(CONN_GROUP))
+_conn_matcher = ConnMatcher(CONN_GROUP + _conn_parts)
+
 class Sentence(object):
     __slots__ = ('leaves', 'id', 'tree', 'true_connectives', 'checked_connectives', 'depTree', 'words', 'word_ids',
             'begin_offset', 'end_offset', 'clauses')
@@ -29,69 +35,63 @@ class Sentence(object):
         if not self.tree.is_null():
             self.leaves = self.tree.root.get_leaves()
 
-    def _find_intra_conn(self, conn_parts, n, k, offset, checked, alls):
+    def _find_intra_conn(self, conn_parts, starts, k, offset, checked, alls):
+        """
+        collect into alls the ways the parts k.. of an intra-sentential connective
+        occur in order from offset on, starts: {part: [start, ...]}
+
+        the lists in `checked' are shared between the levels and the later
+        occurrences of a part, so a level only ever has two branches that can
+        still complete, the rest only extend the list they were handed
+        """
+        n = len(conn_parts)
         if n == k:
             if len(checked) == n:
                 alls.append(checked)
+        elif len(checked) > k:
+            # too long to be completed, takes the first occurrence of each part in turn
+            while k < n:
+                positions = starts[conn_parts[k]]
+                j = bisect_left(positions, offset)
+                if j == len(positions):
+                    break
+                offset = positions[j] + len(conn_parts[k].split())
+                checked.append(self.leaves[positions[j]:offset])
+                k += 1
         else:
-            length = len(self.leaves)
-            conns = conn_parts[k].split()
-            len_conns = len(conns)
             prev_checked = copy.copy(checked)
-
-            for i in range(offset, length - len_conns + 1):
-                ok = True
-                curr = []
-                for j in range(len_conns):
-                    if conns[j] != self.leaves[i+j].value:
-                        ok = False
-                        break
-                    else:
-                        curr.append(self.leaves[i+j])
-                if ok and len(curr) != 0:
-                    checked.append(curr)
-                    self._find_intra_conn(conn_parts, n, k+1, i+len_conns, checked, alls)
-                    checked = prev_checked
-
-    def check_intra_connectives(self):
+            positions = starts[conn_parts[k]]
+            len_conns = len(conn_parts[k].split())
+            for i in positions[bisect_left(positions, offset):]:
+                checked.append(self.leaves[i:i+len_conns])
+                self._find_intra_conn(conn_parts, starts, k+1, i+len_conns, checked, alls)
+                checked = prev_checked
+
+    def _intra_conn_candidates(self, starts):
         for a in CONN_INTRA:
             conn_parts = a.split('..')
             alls = []
-            check = []
-            self._find_intra_conn(conn_parts, len(conn_parts), 0, 0, check, alls)
-            if len(alls) > 0:
-                for can in alls:
-                    print ' '.join(n.value for n in can), '||', a
+            self._find_intra_conn(conn_parts, starts, 0, 0, [], alls)
+            for can in alls:
+                yield a, can
+
+    def check_intra_connectives(self):
+        matches = _conn_matcher.find([leaf.value for leaf in self.leaves])
+        for a, can in self._intra_conn_candidates(_conn_matcher.positions(matches)):
+            print ' '.join(n.value for n in can), '||', a
 
     def check_connectives(self):
-        length = len(self.leaves)
-        for a in CONN_INTRA:
-            conn_parts = a.split('..')
-            alls = []
-            check = []
-            self._find_intra_conn(conn_parts, len(conn_parts), 0, 0, check, alls)
-            if len(alls) > 0:
-                for can in alls:
-                    t = []
-                    for c in can:
-                        t += c
-                    self.checked_connectives.append(t)
-
-        for a in CONN_GROUP:
-            conns = a.split()
-            len_conns = len(conns)
-            for i in range(length-len_conns+1):
-                ok = True
-                checked = []
-                for j in range(len_conns):
-                    if conns[j] != self.leaves[i+j].value:
-                        ok = False
-                        break
-                    else:
-                        checked.append(self.leaves[i+j])
-
-                if ok:
-                    self.checked_connectives.append(checked)
+        matches = _conn_matcher.find([leaf.value for leaf in self.leaves])
+        for a, can in self._intra_conn_candidates(_conn_matcher.positions(matches)):
+            t = []
+            for c in can:
+                t += c
+            self.checked_connectives.append(t)
+
+        for rank, i in matches:
+            if rank >= len(CONN_GROUP):
+                break
+            self.checked_connectives.append(self.leaves[i:i+len(CONN_GROUP[rank].split())])
         return self.checked_connectives
 
     def get_syntactic_features(self, self_node, parent_node, left_sib_node, right_sib_node):
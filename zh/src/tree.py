@@ -4,41 +4,65 @@ import re
 from common import is_punc
 logs = sys.stderr
 
+# parentheses, or a run of anything else up to the next blank or parenthesis
+_tokenizer = re.compile(r'[()]|[^\s()]+')
+# labels of the artificial top node some parsers wrap the tree in
+_top_labels = {'ROOT', 'S1', 'TOP'}
+
+
 class Tree(object):
-    __slots__ = ('sent_id', 'tree_text', 'root')
+    __slots__ = ('sent_id', 'tree_text', 'root', 'leaves', 'index')
 
     def __init__(self, tree_text, sent_id):
         self.sent_id = sent_id
+        self.leaves = []
+        self.index = None
         self.tree_text = tree_text.strip()
         if self.tree_text == "(())":
             return None
-        self.tree_text = re.sub(r'\(ROOT\n*', '( ', self.tree_text)
-        self.tree_text = re.sub(r'\(S1 ', '( ', self.tree_text)
-        self.tree_text = re.sub(r'\(TOP ', '( ', self.tree_text)
-        self.tree_text = re.sub(r'\s+', ' ', self.tree_text)
-        self.tree_text = re.sub(r'^\(\s*\(\s*', '', self.tree_text)
-        self.tree_text = re.sub(r'\s*\)\s*\)$', '', self.tree_text)
-        self.tree_text = re.sub(r'\(', ' ( ', self.tree_text)
-        self.tree_text = re.sub(r'\)', ' ) ', self.tree_text)
-
-        tokens = self.tree_text.split()
-        stack = []
+        tokens = _tokenizer.findall(self.tree_text)
+        tokens = [t for i, t in enumerate(tokens)
+                  if not (i > 0 and t in _top_labels and tokens[i-1] == '(')]
+        # "( (S ...) )" -> "S ...", the outermost pair of brackets is dropped
+        if tokens[:2] == ['(', '(']:
+            del tokens[:2]
+        if tokens[-2:] == [')', ')']:
+            del tokens[-2:]
+
+        # one frame per open bracket, holding its label and the children read so far
+        frames = [[]]
         for token in tokens:
-            if token != ')':
-                stack.append(token)
-            else:
-                nodes = []
-                while True:
-                    popped = stack.pop()
-                    if popped == '(':
-                        break
-                    nodes.insert(0, popped)
-                node = Node(nodes.pop(0), nodes)
+            if token == '(':
+                frames.append([])
+            elif token == ')':
+                nodes = frames.pop()
+                node = Node(nodes[0], nodes[1:])
                 node.tree = self
-                stack.append(node)
-        self.root = Node(stack.pop(0), stack)
+                self._set_span(node)
+                frames[-1].append(node)
+            else:
+                frames[-1].append(token)
+        if len(frames) != 1:
+            raise ValueError('unbalanced parse tree: %s' % self.tree_text)
+        stack = frames[0]
+        self.root = Node(stack[0], stack[1:])
         self.root.is_root = True
         self.root.tree = self
+        self._set_span(self.root)
+
+    def _set_span(self, node):
+        """
+        nodes are completed left to right and children first, so the span of
+        a node is known as soon as it is built
+        """
+        if node.is_pos:
+            node.leaf_node.tree = self
+            begin = len(self.leaves)
+            if not node.leaf_node.is_NONE_leaf:
+                self.leaves.append(node.leaf_node)
+            node.span = node.leaf_node.span = (begin, len(self.leaves))
+        else:
+            node.span = (node.child_nodes[0].span[0], node.child_nodes[-1].span[1])
 
     def __str__(self):
         return self.tree_text
@@ -48,56 +72,65 @@ class Tree(object):
     def is_null(self):
         return self.tree_text == "(())"
 
+    def get_index(self):
+        """ built on first use, the tree must not change afterwards """
+        if self.index is None:
+            self.index = TreeIndex(self.root)
+        return self.index
+
     def find_subtrees(self, leaves):
         if len(leaves) == 0:
             return []
 
-        if len(self.root.get_leaves()) - len(leaves) <= 4:
+        if len(self.leaves) - len(leaves) <= 4:
             return [self.root]
 
-        # bottom-top mark
+        # a node is taken whole when every leaf under it, traces included, is
+        # one of `leaves'; the taken nodes closest to the root are returned in
+        # breadth first order
+        marked = [0] * (len(self.leaves) + 1)
         for n in leaves:
-            n.recursive_up_mark()
+            marked[n.span[0] + 1] = 1
+        for k in range(len(self.leaves)):
+            marked[k + 1] += marked[k]
 
-        # up-down remove
+        index = self.get_index()
         res = []
-        Q = [self.root]
-        while len(Q) != 0:
-            node = Q.pop(0)
-            flag = True
-            for c in node.child_nodes:
-                if not c.is_recursive_included():
-                    flag = False
-                    break
-            if flag:
-                res.append(node)
-            else:
-                for c in node.child_nodes:
-                    if c.included:
-                        Q.append(c)
-
-        # unmark
-        for n in leaves:
-            n.recursive_up_unmark()
-        return res
+        i = 0
+        while i < len(index.nodes):
+            begin, end = index.nodes[i].span
+            last = index.last[i]
+            covered = marked[end] - marked[begin]
+            # leaves under the node, the -NONE- ones included
+            size = last - i + 1 - (index.inner_begin[last + 1] - index.inner_begin[i])
+            if covered == end - begin == size:
+                res.append(i)
+            elif covered > 0:
+                i += 1
+                continue
+            i = last + 1
+        res.sort(key=index.depth.__getitem__)
+        return [index.nodes[i] for i in res]
 
     def find_highest_common_ancestor(self, nodes):
+        """
+        the first node in breadth first order whose leaves are all in nodes
+        """
         if len(nodes) == 0:
             print >> logs, "error: empty nodes"
             return
         else:
-            lca = None
-            queue = [self.root]
-            while len(queue) != 0:
-                curr = queue.pop(0)
-                leaves = curr.get_leaves()
-                if len(leaves) != 0 and len(set(leaves)-set(nodes)) == 0:
-                    lca = curr
-                    break
-                else:
-                    for ch in curr.child_nodes:
-                        queue.append(ch)
-            return lca
+            index = self.get_index()
+            nodes = set(nodes)
+            # marked[i]: how many of the first i leaves are in nodes
+            marked = [0]
+            for leaf in self.leaves:
+                marked.append(marked[-1] + (leaf in nodes))
+            for i in index.level_order:
+                begin, end = index.nodes[i].span
+                if end > begin and marked[end] - marked[begin] == end - begin:
+                    return index.nodes[i]
+            return None
 
     @staticmethod
     def find_least_common_ancestor(nodes, with_leaves=False):
@@ -109,39 +142,32 @@ class Tree(object):
                 lca = lca.parent_node
             return lca
         else:
-            lca = None
-            queue = [nodes[0].goto_tree().root]
-            while len(queue) != 0:
-                curr = queue.pop(0)
-                if len(set(curr.get_all_nodes(with_leaves)) & (set(nodes))) == len(nodes):
-                    lca = curr
-                    for ch in curr.child_nodes:
-                        queue.append(ch)
-            return lca
-
+            # a repeated node, a leaf when leaves are not counted, or a node of
+            # another tree leaves the nodes without a common ancestor
+            if len(set(nodes)) != len(nodes):
+                return None
+            if not with_leaves and any(n.is_leaf for n in nodes):
+                return None
+            index = nodes[0].goto_tree().get_index()
+            if any(n not in index.order for n in nodes):
+                return None
+            first = min(nodes, key=index.order.get)
+            last = max(nodes, key=index.order.get)
+            return index.lca(first, last)
 
     @staticmethod
     def relative_position(node1, node2):
-        root = node1.goto_tree().root
-        if node1 == node2 or node2 == root:
+        """
+        :return: '1' if node2 is on the right of node1, '2' if on the left,
+        '0' if one contains the other, node2 is a leaf or in another tree
+        """
+        index = node1.goto_tree().get_index()
+        if node2.is_leaf or node2 not in index.order:
             return '0'
-        curr = node1
-        rsibs = []
-        lsibs = []
-        while curr != root:
-            rsibs += curr.all_right_siblings()
-            lsibs += curr.all_left_siblings()
-            curr = curr.parent_node
-            if curr == node2:
-                return '0'
-        for rsib in rsibs:
-            if node2 in rsib.get_all_nodes():
-                return '1'
-
-        for lsib in lsibs:
-            if node2 in lsib.get_all_nodes():
-                return '2'
-
+        if index.is_left_of(node1, node2):
+            return '1'
+        if index.is_left_of(node2, node1):
+            return '2'
         return '0'
 
     @staticmethod
@@ -198,10 +224,117 @@ class Tree(object):
         else:
             return path
 
+_phrase_labels = {}
+
+
+def _phrase_label(label):
+    """
+    strip the indices and the function tag of a phrase label,
+    worked out once per distinct label
+    :return: (value, fun_tag), fun_tag is False if the label has none
+    """
+    if label in _phrase_labels:
+        return _phrase_labels[label]
+    value = re.sub(r'=\d+', '', label).split('|')[0]
+    fun_tag = False
+    if re.search(r'.-.', value):
+        fun_tag = value[value.index('-') + 1:-1]
+        fun_tag = re.sub(r'--+', '-', re.sub(r'\b\d+\b', '', fun_tag))
+        if fun_tag == '':
+            fun_tag = None
+        value = value[0:value.index('-')]
+    _phrase_labels[label] = value, fun_tag
+    return value, fun_tag
+
+
+class TreeIndex(object):
+    """
+    pre-order numbering of the nodes of a tree, leaves included, with the
+    subtree interval and depth of each node, and an euler tour with a
+    sparse table for constant time least common ancestor queries
+    """
+    __slots__ = ('nodes', 'order', 'last', 'depth', 'inner', 'inner_begin',
+                 'level_order', 'first', 'euler', 'sparse')
+
+    def __init__(self, root):
+        self.nodes = []
+        self.order = {}
+        self.last = []
+        self.depth = []
+        self.inner = []
+        # inner_begin[i]: how many of the first i nodes are not leaves
+        self.inner_begin = []
+        self.first = []
+        self.euler = []
+        stack = [(root, 0, False)]
+        while len(stack) > 0:
+            node, depth, finished = stack.pop()
+            if finished:
+                i = self.order[node]
+                self.last[i] = len(self.nodes) - 1
+                if node is not root:
+                    self.euler.append(self.order[node.parent_node])
+                continue
+            i = len(self.nodes)
+            self.order[node] = i
+            self.nodes.append(node)
+            self.depth.append(depth)
+            self.last.append(i)
+            self.inner_begin.append(len(self.inner))
+            if not node.is_leaf:
+                self.inner.append(node)
+            self.first.append(len(self.euler))
+            self.euler.append(i)
+            stack.append((node, depth, True))
+            for child in reversed(node.child_nodes):
+                stack.append((child, depth + 1, False))
+        self.inner_begin.append(len(self.inner))
+
+        # breadth first order is pre-order sorted by depth
+        self.level_order = sorted(range(len(self.nodes)), key=self.depth.__getitem__)
+
+        # sparse[k][i]: the shallowest node of euler[i:i+2**k]
+        self.sparse = [self.euler]
+        k = 1
+        while 2 * k <= len(self.euler):
+            prev = self.sparse[-1]
+            row = []
+            for i in range(len(self.euler) - 2 * k + 1):
+                a, b = prev[i], prev[i + k]
+                row.append(a if self.depth[a] <= self.depth[b] else b)
+            self.sparse.append(row)
+            k *= 2
+
+    def is_ancestor(self, node1, node2):
+        """ node1 is node2 or one of its ancestors """
+        i, j = self.order[node1], self.order[node2]
+        return i <= j <= self.last[i]
+
+    def is_left_of(self, node1, node2):
+        """ node1 and its descendants all come before node2 """
+        return self.last[self.order[node1]] < self.order[node2]
+
+    def subtree(self, node, with_leaves=False):
+        """ node and its descendants in pre-order """
+        i = self.order[node]
+        if with_leaves:
+            return self.nodes[i:self.last[i] + 1]
+        return self.inner[self.inner_begin[i]:self.inner_begin[self.last[i] + 1]]
+
+    def lca(self, node1, node2):
+        l, r = self.first[self.order[node1]], self.first[self.order[node2]]
+        if l > r:
+            l, r = r, l
+        k = (r - l + 1).bit_length() - 1
+        a, b = self.sparse[k][l], self.sparse[k][r - (1 << k) + 1]
+        return self.nodes[a if self.depth[a] <= self.depth[b] else b]
+
+
 class Node(object):
     __slots__ = ('value', 'lowercased', 'child_nodes', 'parent_node', 'is_root', 'is_pos',
                  'leaf_node', 'fun_tag', 'is_leaf', 'size', 'tree',
-                 'is_NONE_leaf', 'included', 'dep', 'lemmatized', 'stem', 'is_conn', 'linker', 'leaf_id', 'sbar_1st_leaf')
+                 'is_NONE_leaf', 'included', 'dep', 'lemmatized', 'stem', 'is_conn', 'leaf_id', 'sbar_1st_leaf',
+                 'span')
 
     def __init__(self, value, child_nodes):
         self.value = value.encode('utf-8')
@@ -213,7 +346,6 @@ class Node(object):
         self.is_pos = False
         self.is_leaf = False
         self.is_conn = False
-        self.linker = 'None'
         self.size = 0
         self.tree = None
         self.is_NONE_leaf = False
@@ -226,24 +358,15 @@ class Node(object):
             self.is_pos = True
             leaf_node = self.child_nodes[0] = Node(child_nodes[0], [])
             leaf_node.is_leaf = True
-            leaf_node.value = re.sub(r'_', '-', leaf_node.value)
-            self.leaf_node = self.child_nodes[0]
-            if re.search(r'-NONE-', self.value):
-                self.leaf_node.is_NONE_leaf = True
+            leaf_node.value = leaf_node.value.replace('_', '-')
+            self.leaf_node = leaf_node
+            if '-NONE-' in self.value:
+                leaf_node.is_NONE_leaf = True
 
         if not self.is_pos and len(self.child_nodes) > 0:
-            self.value = re.sub(r'=\d+', '', self.value)
-            if re.search(r'|', self.value):
-                tokens = self.value.split('|')
-                self.value = tokens[0]
-
-            if re.search(r'.-.', self.value):
-                fun_tag = self.value[self.value.index('-') + 1:-1]
-                fun_tag = re.sub(r'--+', '-', re.sub(r'\b\d+\b', '', fun_tag))
+            self.value, fun_tag = _phrase_label(self.value)
+            if fun_tag is not False:
                 self.fun_tag = fun_tag
-                if self.fun_tag == '':
-                    self.fun_tag = None
-                self.value = self.value[0:self.value.index('-')]
 
         if not self.is_leaf:
             for node in child_nodes:
@@ -253,185 +376,168 @@ class Node(object):
         return '%s:%s' % (self.value, ' '.join(n.value for n in self.get_leaves()))
 
     def get_all_nodes(self, with_leaves=False):
-        all_nodes = []
-        self.get_all_nodes_rec(all_nodes, with_leaves)
-        return all_nodes
+        if self.is_leaf:
+            return [self] if with_leaves else []
+        return self.tree.get_index().subtree(self, with_leaves)
 
     def get_all_nodes_rec(self, nodes, with_leaves=False):
-        if self.is_leaf:
-            if with_leaves:
-                nodes.append(self)
-        else:
-            nodes.append(self)
-        for c in self.child_nodes:
-            c.get_all_nodes_rec(nodes, with_leaves)
+        nodes.extend(self.get_all_nodes(with_leaves))
+
+    def iter_preorder(self):
+        """ self and its descendants, leaves included, parents before children """
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.child_nodes))
+
+    def iter_postorder(self):
+        """ self and its descendants, leaves included, children before parents """
+        stack = [(self, False)]
+        while len(stack) > 0:
+            node, finished = stack.pop()
+            if finished:
+                yield node
+            else:
+                stack.append((node, True))
+                stack.extend((ch, False) for ch in reversed(node.child_nodes))
 
     def contains_trace(self):
-        if self.is_NONE_leaf and re.search(r'^\*T\*-', self.value):
-            return True
-        else:
-            for ch in self.child_nodes:
-                if ch.contains_trace():
-                    return True
-            return False
+        for node in self.iter_preorder():
+            if node.is_NONE_leaf and node.value.startswith('*T*-'):
+                return True
+        return False
 
     def contains_node_with_value(self, v):
-        if self.value == v:
-            return True
-        else:
-            for ch in self.child_nodes:
-                if ch.contains_node_with_value(v):
-                    return True
-            return False
+        for node in self.iter_preorder():
+            if node.value == v:
+                return True
+        return False
 
     def get_leaves(self):
-        arr = []
-        self.get_leaves_rec(arr)
-        return arr
+        """ a fresh list, the leaves of the tree in [begin, end) of span """
+        begin, end = self.span
+        if self.is_leaf:
+            return [self] if end > begin else []
+        return self.tree.leaves[begin:end]
 
     def get_leaves_rec(self, arr):
-        if self.is_leaf and not self.is_NONE_leaf:
-            arr.append(self)
-        else:
-            for ch in self.child_nodes:
-                ch.get_leaves_rec(arr)
+        arr.extend(self.get_leaves())
+
+    def num_leaves(self):
+        return self.span[1] - self.span[0]
 
     def goto_tree(self):
-        if not self.is_root:
-            return self.parent_node.goto_tree()
-        else:
-            return self.tree
+        return self.tree
 
     def label_node_size(self):
-        if self.is_leaf and self.is_NONE_leaf:
-            self.size = 0
-        elif self.is_leaf and not self.is_NONE_leaf:
-            self.size = 1
-        else:
-            tmp = 0
-            for ch in self.child_nodes:
-                tmp += ch.label_node_size()
-            self.size = tmp
-
+        for node in self.iter_preorder():
+            node.size = node.num_leaves()
         return self.size
 
     def mark_subtree_included(self):
-        self.included = True
-        for ch in self.child_nodes:
-            ch.mark_subtree_included()
+        for node in self.iter_preorder():
+            node.included = True
 
     def unmark_subtree_included(self):
-        self.included = False
-        for ch in self.child_nodes:
-            ch.unmark_subtree_included()
+        for node in self.iter_preorder():
+            node.included = False
 
     def pre_order(self):
         """ print ptb style tree"""
-        if self.is_leaf:
-            to_line = "%s" % self.value
-        else:
-            to_line = "(%s " % self.value
-
-        for n in self.child_nodes:
-            to_line += n.pre_order()
-        if not self.is_leaf:
-            to_line += ") "
-        return to_line
+        lines = {}
+        for node in self.iter_postorder():
+            sub_line = ''.join(lines.pop(ch) for ch in node.child_nodes)
+            if node.is_leaf:
+                lines[node] = "%s" % node.value + sub_line
+            else:
+                lines[node] = "(%s " % node.value + sub_line + ") "
+        return lines[self]
 
     def pre_order_included(self, with_leaf=False):
         """
         pre order print parse tree (designed for tree kernel)
         """
-        if not self.included:
-            to_line = ''
-        elif self.is_leaf:
-            to_line = "%s" % self.value
-        else:
-            if with_leaf and self.value == '-NONE-':
-                return ''
+        lines = {}
+        for node in self.iter_postorder():
+            sub_line = ''.join(lines.pop(ch) for ch in node.child_nodes)
+            if not node.included:
+                to_line = ''
+            elif node.is_leaf:
+                to_line = "%s" % node.value
             else:
-                to_line = "(%s " % self.value
+                if with_leaf and node.value == '-NONE-':
+                    lines[node] = ''
+                    continue
+                else:
+                    to_line = "(%s " % node.value
 
-        sub_line = ''
-        for n in self.child_nodes:
-            sub_line += n.pre_order_included(with_leaf)
-        if to_line != '' and not self.is_leaf and sub_line == '':
-            sub_line = 'null'
+            if to_line != '' and not node.is_leaf and sub_line == '':
+                sub_line = 'null'
 
-        to_line += sub_line
-        if not self.is_leaf and self.included:
-            to_line += ")"
-        return to_line
+            to_line += sub_line
+            if not node.is_leaf and node.included:
+                to_line += ")"
+            lines[node] = to_line
+        return lines[self]
 
     def get_len_of_verb_phrases(self, arr=[]):
         """ get verb phrases length
         """
-        if self.value == 'VP':
-            arr.append(len(self.get_leaves()))
+        for node in self.iter_preorder():
+            if node.value == 'VP':
+                arr.append(node.num_leaves())
 
-        for ch in self.child_nodes:
-            ch.get_len_of_verb_phrases(arr)
+    @staticmethod
+    def _rule_lhs(value):
+        # the function tag is cut, its dash is kept
+        if '-' in value[1:-1]:
+            return value[:value.index('-') + 1] + '->'
+        return value + '->'
 
     def get_production_rules(self, rule_cnts, nary=2, with_leaf=True):
-        if not self.is_pos:
-            if re.search(r'.-.', self.value):
-                rule = self.value[:self.value.index('-') + 1] + '->'
-            else:
-                rule = self.value + '->'
-            child_ptr = [n for n in self.child_nodes
-                         if n.value.find('-NONE-') == -1]
-            if nary != -1 and len(child_ptr) > nary:
-                for i in range(len(child_ptr) - nary):
-                    rule2 = rule + '_'.join(n.value for n in child_ptr[i:i + nary])
-                    rule_cnts[rule2] += 1
-            else:
-                rule += '_'.join(n.value for n in child_ptr)
-                if not re.search('->$', rule):  # rule has child values
-                    rule_cnts[rule] += 1
-            for n in child_ptr:
-                n.get_production_rules(rule_cnts, nary, with_leaf)
-        elif with_leaf and self.value.find('-NONE-') == -1:
-            rule_cnts[self.value + '->' + self.leaf_node.value] += 1
+        stack = [self]
+        while len(stack) > 0:
+            node = stack.pop()
+            if not node.is_pos:
+                rule = Node._rule_lhs(node.value)
+                child_ptr = [n for n in node.child_nodes
+                             if n.value.find('-NONE-') == -1]
+                if nary != -1 and len(child_ptr) > nary:
+                    for i in range(len(child_ptr) - nary):
+                        rule2 = rule + '_'.join(n.value for n in child_ptr[i:i + nary])
+                        rule_cnts[rule2] += 1
+                else:
+                    rule += '_'.join(n.value for n in child_ptr)
+                    if not rule.endswith('->'):  # rule has child values
+                        rule_cnts[rule] += 1
+                stack.extend(reversed(child_ptr))
+            elif with_leaf and node.value.find('-NONE-') == -1:
+                rule_cnts[node.value + '->' + node.leaf_node.value] += 1
 
     def get_unary_production_rules(self, rule_cnts, with_leaf=True):
         """decompose production rules as unary rule, e.g. S->VP NP,
         we will get S->VP, S->NP two production rules
         """
-        if not self.is_pos:
-            if re.search(r'.-.', self.value):
-                rule = self.value[:self.value.index('-') + 1] + '->'
-            else:
-                rule = self.value + '->'
-            child_ptr = [n for n in self.child_nodes
-                         if n.value.find('-NONE-') == -1]
-            for n in child_ptr:
-                t = rule + n.value
-                if not re.search('->$', t):
-                    rule_cnts[t] += 1
-                n.get_unary_production_rules(rule_cnts, with_leaf)
-        elif with_leaf and self.value.find('-NONE-') == -1:
-            rule_cnts[self.value + '->' + self.leaf_node.value] += 1
-
-    def recursive_up_mark(self):
-        p = self
-        while p is not None:
-            p.included = True
-            p = p.parent_node
-
-    def recursive_up_unmark(self):
-        p = self
-        while p is not None:
-            p.included = False
-            p = p.parent_node
+        # each node is pushed with the rule from its parent, counted when it is visited
+        stack = [(self, None)]
+        while len(stack) > 0:
+            node, t = stack.pop()
+            if t is not None and not t.endswith('->'):
+                rule_cnts[t] += 1
+            if not node.is_pos:
+                rule = Node._rule_lhs(node.value)
+                child_ptr = [n for n in node.child_nodes
+                             if n.value.find('-NONE-') == -1]
+                stack.extend((n, rule + n.value) for n in reversed(child_ptr))
+            elif with_leaf and node.value.find('-NONE-') == -1:
+                rule_cnts[node.value + '->' + node.leaf_node.value] += 1
 
     def is_recursive_included(self):
-        if self.is_leaf:
-            return self.included
-        else:
-            for c in self.child_nodes:
-                if not c.is_recursive_included():
-                    return False
-            return True
+        for node in self.iter_preorder():
+            if node.is_leaf and not node.included:
+                return False
+        return True
 
     def all_left_siblings(self, remove_punc=False):
         if self.parent_node is not None:
@@ -455,28 +561,20 @@ class Node(object):
                     return self.parent_node.child_nodes[i+1:len(self.parent_node.child_nodes)]
         return []
 
-    def recursive_set_linker(self, v):
-        self.linker = v
-        for n in self.child_nodes:
-            n.recursive_set_linker(v)
-
     def mark_edge_1st_leaves(self, all_leavs):
         if len(all_leavs) <= 0:
             return
 
-        if (self.value == 'SBAR' and self.parent_node is not None and self.parent_node.value == 'VP') or \
-            (self.value == 'SINV' and self.parent_node is not None and self.parent_node.value == 'S') or \
-            (self.value == 'S' and self.parent_node is not None and self.parent_node.value == 'S') or \
-            (self.value == 'S' and self.parent_node is not None and self.parent_node.value == 'SINV') or \
-            (self.value == 'SBAR' and self.parent_node is not None and self.parent_node.value == 'S'):
-                arr = self.get_leaves()
-                last_idx = all_leavs.index(arr[-1])
-                if len(arr) > 0:
-                    arr[0].sbar_1st_leaf = True
-                    if last_idx < len(all_leavs) - 1:
-                        all_leavs[last_idx+1].sbar_1st_leaf = True
-                arr = []
-
-        for child in self.child_nodes:
-            child.mark_edge_1st_leaves(all_leavs)
-
+        for node in self.iter_preorder():
+            parent = node.parent_node
+            if (node.value == 'SBAR' and parent is not None and parent.value == 'VP') or \
+                (node.value == 'SINV' and parent is not None and parent.value == 'S') or \
+                (node.value == 'S' and parent is not None and parent.value == 'S') or \
+                (node.value == 'S' and parent is not None and parent.value == 'SINV') or \
+                (node.value == 'SBAR' and parent is not None and parent.value == 'S'):
+                    arr = node.get_leaves()
+                    last_idx = all_leavs.index(arr[-1])
+                    if len(arr) > 0:
+                        arr[0].sbar_1st_leaf = True
+                        if last_idx < len(all_leavs) - 1:
+                            all_leavs[last_idx+1].sbar_1st_leaf = True